@@ -0,0 +1,141 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import case, func, select, update
+
+from .models import Alumno, DocenteMateria, Inscripcion, Kardex, Materia
+
+# Student aggregates
+# Every kardex row with a calificacion_final counts towards its student:
+#   creditos_cursados  = sum of materia.creditos over graded kardex rows
+#   creditos_aprobados = sum of materia.creditos over approved kardex rows
+#   puntos_ponderados  = sum of creditos * calificacion_final over graded kardex rows (exact DECIMAL)
+#   promedio_general   = puntos_ponderados / creditos_cursados (NULL with no credits)
+# Retakes are separate kardex rows and each one counts. The columns are kept current with
+# deltas as finals change; scripts/rebuild_student_aggregates.py recomputes them from scratch.
+# The average is always derived from the exact sum, never from the previous float average,
+# so rounding does not accumulate across updates.
+
+
+def kardex_context(db, kardex_ids):
+    """
+    {kardex_id: (alumno_id, creditos, calificacion_final, aprobado)} as currently stored.
+    The kardex rows stay locked until the caller's transaction ends, so a concurrent grade
+    write waits and then reads this transaction's values instead of the same before-image.
+    """
+    if not kardex_ids:
+        return {}
+    rows = db.execute(
+        select(Kardex.id, Inscripcion.alumno_id, Materia.creditos, Kardex.calificacion_final, Kardex.aprobado)
+        .join(Inscripcion, Inscripcion.id == Kardex.inscripcion_id)
+        .join(DocenteMateria, DocenteMateria.id == Inscripcion.docente_materia_id)
+        .join(Materia, Materia.id == DocenteMateria.materia_id)
+        .where(Kardex.id.in_(kardex_ids))
+        .order_by(Kardex.id)
+        .with_for_update(of=Kardex)
+    ).all()
+    return {kardex_id: (alumno_id, creditos or 0, final, aprobado) for kardex_id, alumno_id, creditos, final, aprobado in rows}
+
+
+def _contribution(creditos, final, aprobado):
+    if final is None:
+        return 0, 0, Decimal(0)
+    return creditos, creditos if aprobado else 0, creditos * Decimal(str(round(final, 2)))
+
+
+def apply_kardex_changes(db, context, finals):
+    """
+    Applies the change of each kardex in `finals` ({kardex_id: (calificacion_final, aprobado)})
+    relative to the values captured in `context` (from kardex_context, locked before the write)
+    with one relative UPDATE per affected student. Does not commit.
+    """
+    deltas = defaultdict(lambda: [0, 0, Decimal(0)])
+    for kardex_id, (new_final, new_aprobado) in finals.items():
+        if kardex_id not in context:
+            continue
+        alumno_id, creditos, old_final, old_aprobado = context[kardex_id]
+        old = _contribution(creditos, old_final, old_aprobado)
+        new = _contribution(creditos, new_final, new_aprobado)
+        if old == new:
+            continue
+        delta = deltas[alumno_id]
+        delta[0] += new[0] - old[0]
+        delta[1] += new[1] - old[1]
+        delta[2] += new[2] - old[2]
+
+    cursados_actuales = func.coalesce(Alumno.creditos_cursados, 0)
+    puntos_actuales = func.coalesce(Alumno.puntos_ponderados, 0)
+    for alumno_id, (cursados, aprobados, puntos) in deltas.items():
+        db.execute(
+            update(Alumno).where(Alumno.id == alumno_id).ordered_values(
+                # promedio_general first: MySQL evaluates SET left to right with updated values
+                (Alumno.promedio_general, case(
+                    (cursados_actuales + cursados > 0, (puntos_actuales + puntos) / (cursados_actuales + cursados)),
+                    else_=None
+                )),
+                (Alumno.puntos_ponderados, puntos_actuales + puntos),
+                (Alumno.creditos_cursados, cursados_actuales + cursados),
+                (Alumno.creditos_aprobados, func.coalesce(Alumno.creditos_aprobados, 0) + aprobados),
+            ).execution_options(synchronize_session=False)
+        )
+    return len(deltas)
+
+
+def student_totals(rows):
+    """Folds (creditos, calificacion_final, aprobado) rows of one student into column values."""
+    cursados, aprobados, puntos = 0, 0, Decimal(0)
+    for creditos, final, aprobado in rows:
+        c, a, p = _contribution(creditos or 0, final, aprobado)
+        cursados += c
+        aprobados += a
+        puntos += p
+    return {
+        "promedio_general": float(puntos / cursados) if cursados else None,
+        "puntos_ponderados": puntos,
+        "creditos_cursados": cursados,
+        "creditos_aprobados": aprobados,
+    }
+
+
+def rebuild_student_aggregates(read_db, write_db, batch_size=1000, progress=None):
+    """
+    Recomputes the aggregates of every student in one pass over a server-side cursor ordered
+    by alumno_id (read_db) and writes them in bulk UPDATEs of `batch_size` students (write_db,
+    committed per batch). Students without kardex rows are reset to zero.
+    """
+    stream = read_db.execute(
+        select(Alumno.id, Materia.creditos, Kardex.calificacion_final, Kardex.aprobado)
+        .outerjoin(Inscripcion, Inscripcion.alumno_id == Alumno.id)
+        .outerjoin(Kardex, Kardex.inscripcion_id == Inscripcion.id)
+        .outerjoin(DocenteMateria, DocenteMateria.id == Inscripcion.docente_materia_id)
+        .outerjoin(Materia, Materia.id == DocenteMateria.materia_id)
+        .order_by(Alumno.id)
+        .execution_options(yield_per=batch_size * 10)
+    )
+
+    pending = []
+    updated = 0
+
+    def flush():
+        nonlocal updated
+        write_db.execute(update(Alumno), pending)
+        write_db.commit()
+        updated += len(pending)
+        pending.clear()
+        if progress:
+            progress(updated)
+
+    current_id, rows = None, []
+    for alumno_id, creditos, final, aprobado in stream:
+        if alumno_id != current_id:
+            if current_id is not None:
+                pending.append(dict(student_totals(rows), id=current_id))
+                if len(pending) >= batch_size:
+                    flush()
+            current_id, rows = alumno_id, []
+        rows.append((creditos, final, aprobado))
+    if current_id is not None:
+        pending.append(dict(student_totals(rows), id=current_id))
+    if pending:
+        flush()
+    return updated
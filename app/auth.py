@@ -4,6 +4,11 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+import time
 import os
 
 # --- Token Validation ---
@@ -12,12 +17,101 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 # --- Password Hashing ---
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def verify_password(plain_password, hashed_password):
+def _verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
+def _hash_password(password):
     return pwd_context.hash(password)
 
+
+# bcrypt costs ~250ms of CPU per call. Running it in the request threadpool lets a login
+# burst starve every other endpoint, so it runs in a small dedicated process pool instead.
+# At most AUTH_HASH_WORKERS + AUTH_HASH_MAX_QUEUE calls may be in flight per web worker;
+# beyond that callers get a 503 with Retry-After rather than piling up.
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+AUTH_HASH_MAX_QUEUE = int(os.getenv("AUTH_HASH_MAX_QUEUE", "16"))
+AUTH_HASH_RETRY_AFTER = int(os.getenv("AUTH_HASH_RETRY_AFTER", "2"))
+
+
+class HashingPool:
+    def __init__(self, workers, max_queue, retry_after):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_queue_time = 0.0
+        self.total_run_time = 0.0
+
+    def _get_executor(self):
+        # Created lazily so every gunicorn worker gets its own pool after forking;
+        # children are spawned rather than forked from the (threaded) web worker
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is busy, please retry shortly",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        submitted = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            result, run_time = self._get_executor().submit(_timed_call, fn, *args).result()
+        finally:
+            elapsed = time.perf_counter() - submitted
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+        with self._lock:
+            self.completed += 1
+            self.total_run_time += run_time
+            self.total_queue_time += max(elapsed - run_time, 0.0)
+        return result
+
+    def status(self):
+        with self._lock:
+            completed = self.completed
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queued": max(self.in_flight - self.workers, 0),
+                "completed": completed,
+                "rejected": self.rejected,
+                "avg_queue_ms": round(self.total_queue_time / completed * 1000, 3) if completed else 0.0,
+                "avg_run_ms": round(self.total_run_time / completed * 1000, 3) if completed else 0.0,
+            }
+
+
+def _timed_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+hashing_pool = HashingPool(AUTH_HASH_WORKERS, AUTH_HASH_MAX_QUEUE, AUTH_HASH_RETRY_AFTER)
+
+def verify_password(plain_password, hashed_password):
+    return hashing_pool.run(_verify_password, plain_password, hashed_password)
+
+def get_password_hash(password):
+    return hashing_pool.run(_hash_password, password)
+
 # --- JWT Token ---
 SECRET_KEY = os.getenv("SECRET_KEY", "a_default_secret_key_if_not_set")
 ALGORITHM = "HS256"
@@ -33,15 +127,77 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Dashboard pages fire several /me calls in parallel with the same token. Verified payloads are
+# cached (keyed by the token signature) until the token's own expiry so repeats skip the crypto.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
+
+class TokenCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        signing_input, _, signature = token.rpartition(".")
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is not None:
+                cached_input, payload, expires_at = entry
+                if now >= expires_at:
+                    del self._entries[signature]
+                elif cached_input == signing_input:
+                    self._entries.move_to_end(signature)
+                    self.hits += 1
+                    return payload
+            self.misses += 1
+        return None
+
+    def put(self, token, payload):
+        expires_at = payload.get("exp")
+        if not isinstance(expires_at, (int, float)) or self.max_size <= 0:
+            return
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            self._entries[signature] = (signing_input, payload, expires_at)
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def status(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
 def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = token_cache.get(token)
+    if cached is not None:
+        return dict(cached)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        # Return the entire payload so the endpoint can handle it
-        return payload
     except JWTError:
         raise credentials_exception
+    token_cache.put(token, payload)
+    # Return the entire payload so the endpoint can handle it
+    return dict(payload)
@@ -0,0 +1,23 @@
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+
+def upsert(db, model, rows, conflict_columns, update_columns):
+    # Writes `rows` (list of dicts) with one INSERT ... ON DUPLICATE KEY UPDATE on MySQL.
+    # `conflict_columns` names the unique key the rows collide on; it is only needed by
+    # dialects with ON CONFLICT (SQLite/PostgreSQL, used in local tooling).
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(model.__table__).values(rows)
+        stmt = stmt.on_duplicate_key_update({col: stmt.inserted[col] for col in update_columns})
+    elif dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(model.__table__).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={col: stmt.excluded[col] for col in update_columns}
+        )
+    else:
+        raise NotImplementedError(f"Bulk upsert is not supported for dialect '{dialect}'")
+    db.execute(stmt)
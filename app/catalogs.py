@@ -0,0 +1,138 @@
+from collections import namedtuple
+import logging
+import os
+import threading
+import time
+
+from .database import SessionLocal
+from .models import (
+    CatRoles,
+    CatEstatusAlumnos,
+    CatConceptosPago,
+    CatTiposDocumento,
+    CatEstatusDocumento,
+    CatEstatusInscripcion,
+    CatEstatusKardex,
+    CatEstatusPago,
+    CatMetodosPago,
+    CatEstatusServicio,
+    CatTiposNotificacion,
+    CatTiposEventoCalendario,
+)
+
+# Catalog (Cat*) tables are tiny and change only through admin/seed scripts, so every
+# web worker keeps an immutable snapshot of them in memory. Snapshots reload after
+# CATALOG_CACHE_TTL seconds or when invalidated explicitly after a write.
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+CATALOG_MODELS = (
+    CatRoles,
+    CatEstatusAlumnos,
+    CatConceptosPago,
+    CatTiposDocumento,
+    CatEstatusDocumento,
+    CatEstatusInscripcion,
+    CatEstatusKardex,
+    CatEstatusPago,
+    CatMetodosPago,
+    CatEstatusServicio,
+    CatTiposNotificacion,
+    CatTiposEventoCalendario,
+)
+
+
+class Catalog:
+    """Immutable snapshot of one catalog table with id and name lookups."""
+
+    def __init__(self, model, rows, version):
+        self.model = model
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._rows = tuple(rows)
+        self._by_id = {row.id: row for row in self._rows}
+        self._by_name = {row.nombre.lower(): row for row in self._rows}
+
+    def all(self):
+        return self._rows
+
+    def get(self, row_id):
+        return self._by_id.get(row_id)
+
+    def by_name(self, nombre):
+        return self._by_name.get(nombre.lower()) if nombre else None
+
+    def id_for(self, nombre):
+        row = self.by_name(nombre)
+        return row.id if row else None
+
+    def filter(self, **attrs):
+        return [row for row in self._rows if all(getattr(row, k) == v for k, v in attrs.items())]
+
+
+class CatalogCache:
+    def __init__(self, models, ttl_seconds, session_factory=SessionLocal):
+        self.ttl_seconds = ttl_seconds
+        self.session_factory = session_factory
+        # Each model gets a namedtuple row type mirroring its columns
+        self._row_types = {
+            model: namedtuple(f"{model.__name__}Row", [c.key for c in model.__table__.columns])
+            for model in models
+        }
+        self._catalogs = {}
+        self._versions = {model: 0 for model in models}
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _load(self, model, db):
+        row_type = self._row_types[model]
+        columns = [getattr(model, field) for field in row_type._fields]
+        rows = [row_type(*values) for values in db.query(*columns).order_by(model.id).all()]
+        with self._lock:
+            self._versions[model] += 1
+            catalog = Catalog(model, rows, self._versions[model])
+            self._catalogs[model] = catalog
+            self.reloads += 1
+        return catalog
+
+    def get(self, model, db=None):
+        catalog = self._catalogs.get(model)
+        if catalog is not None and time.monotonic() - catalog.loaded_at < self.ttl_seconds:
+            return catalog
+        if db is not None:
+            return self._load(model, db)
+        with self.session_factory() as session:
+            return self._load(model, session)
+
+    def load_all(self):
+        with self.session_factory() as session:
+            for model in self._row_types:
+                self._load(model, session)
+
+    def invalidate(self, model=None):
+        with self._lock:
+            if model is None:
+                self._catalogs.clear()
+            else:
+                self._catalogs.pop(model, None)
+
+    def status(self):
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "reloads": self.reloads,
+                "catalogs": {
+                    model.__tablename__: {"version": catalog.version, "rows": len(catalog.all())}
+                    for model, catalog in self._catalogs.items()
+                },
+            }
+
+
+catalogs = CatalogCache(CATALOG_MODELS, CATALOG_CACHE_TTL)
+
+
+def warm_catalogs():
+    try:
+        catalogs.load_all()
+    except Exception as e:
+        # Lookups fall back to loading on demand
+        logging.error(f"Could not preload catalogs: {e}")
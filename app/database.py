@@ -1,7 +1,12 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
+import ssl
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file for local development
@@ -31,9 +36,237 @@ connect_args = {}
 if DB_SSL_CERT_PATH:
     connect_args["ssl"] = {"ca": DB_SSL_CERT_PATH}
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args
-)
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# --- Connection pool settings ---
+# Every gunicorn worker (see Procfile) owns its own pool, so the total number of
+# connections against MySQL is roughly workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+# Keep that below the server's max_connections.
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)
+# Recycle before MySQL's wait_timeout (and Azure's idle gateway timeout) closes the socket
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+# LIFO reuse keeps a small hot set of connections and lets the idle ones expire
+DB_POOL_USE_LIFO = _env_bool("DB_POOL_USE_LIFO", True)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                if waited > self.max_wait:
+                    self.max_wait = waited
+
+
+def build_engine(url, **overrides):
+    options = dict(
+        connect_args=connect_args,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=DB_POOL_USE_LIFO,
+    )
+    options.update(overrides)
+    return create_engine(url, **options)
+
+
+def pool_status(target_engine=None):
+    pool = (target_engine or engine).pool
+    stats = {
+        "pool_size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout_seconds": DB_POOL_TIMEOUT,
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._wait_lock:
+            checkouts = pool.checkouts
+            stats.update({
+                "checkouts": checkouts,
+                "checkout_timeouts": pool.timeouts,
+                "avg_wait_ms": round(pool.total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+                "max_wait_ms": round(pool.max_wait * 1000, 3),
+            })
+    return stats
+
+
+def check_database(target_engine=None):
+    start = time.perf_counter()
+    with (target_engine or engine).connect() as connection:
+        connection.execute(text("SELECT 1"))
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+engine = build_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+
+# --- Read replicas ---
+# Comma-separated list of replica hosts that share the primary's credentials and schema.
+# When empty, read-only sessions simply go to the primary.
+DB_REPLICA_HOSTS = [h.strip() for h in (os.getenv("DB_REPLICA_HOSTS") or "").split(",") if h.strip()]
+# Replicas lagging more than this many seconds are skipped until they catch up
+DB_REPLICA_MAX_LAG = _env_int("DB_REPLICA_MAX_LAG", 5)
+# How often (seconds) a replica's lag is re-measured
+DB_REPLICA_LAG_CHECK_INTERVAL = _env_int("DB_REPLICA_LAG_CHECK_INTERVAL", 10)
+
+
+class ReplicaRouter:
+    """Round-robins read-only sessions over healthy replicas, falling back to the primary."""
+
+    def __init__(self, primary_engine, replica_engines, max_lag, check_interval):
+        self.primary_engine = primary_engine
+        self.replica_engines = replica_engines
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        # engine -> (checked_at, lag_seconds or None when unreachable)
+        self._lag = {}
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+    def _measure_lag(self, replica_engine):
+        with replica_engine.connect() as connection:
+            try:
+                row = connection.execute(text("SHOW REPLICA STATUS")).mappings().first()
+            except Exception:
+                # MySQL < 8.0.22 only knows the old syntax
+                row = connection.execute(text("SHOW SLAVE STATUS")).mappings().first()
+        if row is None:
+            # Not configured as a replica: treat it as fully caught up
+            return 0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return None if lag is None else int(lag)
+
+    def replica_lag(self, replica_engine):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._lag.get(replica_engine)
+        if cached and now - cached[0] < self.check_interval:
+            return cached[1]
+        try:
+            lag = self._measure_lag(replica_engine)
+        except Exception:
+            lag = None
+        with self._lock:
+            self._lag[replica_engine] = (now, lag)
+        return lag
+
+    def _is_healthy(self, replica_engine):
+        lag = self.replica_lag(replica_engine)
+        return lag is not None and lag <= self.max_lag
+
+    def choose_engine(self):
+        count = len(self.replica_engines)
+        if count:
+            with self._lock:
+                start = self._next
+                self._next = (self._next + 1) % count
+            for offset in range(count):
+                candidate = self.replica_engines[(start + offset) % count]
+                if self._is_healthy(candidate):
+                    with self._lock:
+                        self.replica_reads += 1
+                    return candidate
+            with self._lock:
+                self.primary_fallbacks += 1
+        return self.primary_engine
+
+    def status(self):
+        with self._lock:
+            lags = {str(e.url.host): lag for e, (_, lag) in self._lag.items()}
+            return {
+                "replicas": [str(e.url.host) for e in self.replica_engines],
+                "lag_seconds": lags,
+                "max_lag_seconds": self.max_lag,
+                "replica_reads": self.replica_reads,
+                "primary_fallbacks": self.primary_fallbacks,
+            }
+
+
+replica_engines = [
+    build_engine(f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{host}/{DB_NAME}")
+    for host in DB_REPLICA_HOSTS
+]
+replica_router = ReplicaRouter(engine, replica_engines, DB_REPLICA_MAX_LAG, DB_REPLICA_LAG_CHECK_INTERVAL)
+ReadOnlySessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+def create_readonly_session():
+    return ReadOnlySessionLocal(bind=replica_router.choose_engine())
+
+
+# --- Async engines ---
+# aiomysql takes an SSLContext instead of PyMySQL's {"ca": ...} dict
+async_connect_args = {}
+if DB_SSL_CERT_PATH:
+    async_connect_args["ssl"] = ssl.create_default_context(cafile=DB_SSL_CERT_PATH)
+
+
+def build_async_engine(url, **overrides):
+    options = dict(
+        connect_args=async_connect_args,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=DB_POOL_USE_LIFO,
+    )
+    options.update(overrides)
+    return create_async_engine(url, **options)
+
+
+ASYNC_DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+async_engine = build_async_engine(ASYNC_DATABASE_URL)
+# Each sync engine (primary and replicas) gets an async twin so the replica router can be reused
+async_engines = {engine: async_engine}
+for host, replica_engine in zip(DB_REPLICA_HOSTS, replica_engines):
+    async_engines[replica_engine] = build_async_engine(f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{host}/{DB_NAME}")
+
+# expire_on_commit=False: async sessions cannot lazy-load expired attributes after a commit
+AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine)
+
+
+def create_async_readonly_session():
+    return AsyncSessionLocal(bind=async_engines[replica_router.choose_engine()])
@@ -0,0 +1,262 @@
+import os
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .cache import TTLCache
+from .database import SessionLocal
+from .models import DocenteMateria, Grupo, Inscripcion, InscripcionIdempotencia
+from .schedule import active_enrollment
+from .timetable import _invalidate_alumnos
+
+# ------------------------------------------------------------------
+# Seat reservation
+# cupo_actual is only ever changed by a single conditional UPDATE
+# (... SET cupo_actual = cupo_actual + 1 WHERE cupo_actual < cupo_maximo), never read-modify-write,
+# so concurrent enrollments cannot oversubscribe a section. An enrollment takes a seat of the
+# section (DocenteMateria) and then of its Grupo in the same transaction; if either is full both
+# are rolled back, and a drop frees both. The seat UPDATEs run last in the enrollment transaction:
+# the row locks are held only until the commit that follows, always section first, then grupo.
+# A failed insert or schedule conflict rolls back before any seat is taken.
+#
+# A student who dropped a section (Baja) and enrolls again gets the same inscripcion row back,
+# reactivated and with a newly reserved seat.
+#
+# Clients may send an idempotency key; a retry with the same key returns the enrollment the
+# first request created instead of failing as a duplicate.
+#
+# The availability view is a per-worker snapshot of every section's seats in a periodo, refreshed
+# every SEAT_AVAILABILITY_TTL seconds and patched with the exact counts this worker sees after each
+# reservation. Sections found full are also remembered for FULL_SECTION_TTL seconds so repeated
+# attempts on them are rejected without touching the database.
+# ------------------------------------------------------------------
+
+SEAT_AVAILABILITY_TTL = int(os.getenv("SEAT_AVAILABILITY_TTL", "5"))
+FULL_SECTION_TTL = int(os.getenv("FULL_SECTION_TTL", "2"))
+
+
+class EnrollmentError(ValueError):
+    # reason: "sin_cupo", "no_encontrado", "ya_inscrito" or "clave_reutilizada"
+    def __init__(self, reason, message):
+        self.reason = reason
+        super().__init__(message)
+
+
+def _has_seat(model):
+    return or_(model.cupo_maximo.is_(None), func.coalesce(model.cupo_actual, 0) < model.cupo_maximo)
+
+
+def reserve_seat(db, model, row_id):
+    """Takes one seat of an active Grupo or DocenteMateria in the current transaction. False when full."""
+    result = db.execute(
+        update(model)
+        .where(model.id == row_id, model.activo == True, _has_seat(model))
+        .values(cupo_actual=func.coalesce(model.cupo_actual, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def release_seat(db, model, row_id):
+    db.execute(
+        update(model)
+        .where(model.id == row_id, model.cupo_actual > 0)
+        .values(cupo_actual=model.cupo_actual - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class SeatAvailability:
+    def __init__(self, periodo_id, seats):
+        self.periodo_id = periodo_id
+        self._seats = seats  # docente_materia_id -> (cupo_maximo, cupo_actual)
+
+    @classmethod
+    def load(cls, db, periodo_id):
+        rows = db.execute(
+            select(DocenteMateria.id, DocenteMateria.cupo_maximo, DocenteMateria.cupo_actual).where(
+                DocenteMateria.periodo_id == periodo_id, DocenteMateria.activo == True
+            )
+        )
+        return cls(periodo_id, {dm_id: (maximo, actual or 0) for dm_id, maximo, actual in rows})
+
+    def set(self, docente_materia_id, cupo_maximo, cupo_actual):
+        self._seats[docente_materia_id] = (cupo_maximo, cupo_actual or 0)
+
+    def sections(self):
+        return [
+            {
+                "docente_materia_id": dm_id,
+                "cupo_maximo": maximo,
+                "cupo_actual": actual,
+                "disponibles": None if maximo is None else max(maximo - actual, 0),
+            }
+            for dm_id, (maximo, actual) in sorted(self._seats.items())
+        ]
+
+
+seat_availability_cache = TTLCache(SEAT_AVAILABILITY_TTL, max_size=32)
+full_sections = TTLCache(FULL_SECTION_TTL, max_size=4096)
+
+
+def get_seat_availability(periodo_id, db=None):
+    availability = seat_availability_cache.get(periodo_id)
+    if availability is None:
+        if db is not None:
+            availability = SeatAvailability.load(db, periodo_id)
+        else:
+            with SessionLocal() as session:
+                availability = SeatAvailability.load(session, periodo_id)
+        seat_availability_cache.set(periodo_id, availability)
+    return availability
+
+
+def _section_state(db, docente_materia_id):
+    row = db.execute(
+        select(DocenteMateria.periodo_id, DocenteMateria.cupo_maximo, DocenteMateria.cupo_actual, DocenteMateria.activo)
+        .where(DocenteMateria.id == docente_materia_id)
+    ).first()
+    if row is not None:
+        availability = seat_availability_cache.get(row.periodo_id)
+        if availability is not None:
+            availability.set(docente_materia_id, row.cupo_maximo, row.cupo_actual)
+    return row
+
+
+def _by_idempotency_key(db, clave, alumno_id, docente_materia_id):
+    row = db.get(InscripcionIdempotencia, clave)
+    if row is None:
+        return None
+    if row.alumno_id != alumno_id or row.docente_materia_id != docente_materia_id:
+        raise EnrollmentError("clave_reutilizada", "La clave de idempotencia ya se usó para otra inscripción")
+    return row.inscripcion_id
+
+
+def _reactivate(db, alumno_id, docente_materia_id, estatus_id):
+    """Locks the student's dropped enrollment in the section and marks it active again. None if there is none."""
+    inscripcion = db.execute(
+        select(Inscripcion).where(
+            Inscripcion.alumno_id == alumno_id,
+            Inscripcion.docente_materia_id == docente_materia_id,
+            ~active_enrollment()
+        ).with_for_update()
+    ).scalar_one_or_none()
+    if inscripcion is None:
+        return None
+    inscripcion.estatus_id = estatus_id
+    inscripcion.fecha_baja = None
+    inscripcion.motivo_baja = None
+    try:
+        # Schedule checks treat the reactivated row like a new enrollment
+        db.flush()
+    except Exception:
+        db.rollback()
+        raise
+    return inscripcion
+
+
+def enroll(db, alumno_id, docente_materia_id, estatus_id, idempotency_key=None):
+    """
+    Enrolls a student in a section, reserving one seat of the section and one of its grupo. Commits.
+    Returns (inscripcion_id, created); created is False when the idempotency key was already used.
+    """
+    if idempotency_key:
+        inscripcion_id = _by_idempotency_key(db, idempotency_key, alumno_id, docente_materia_id)
+        if inscripcion_id is not None:
+            return inscripcion_id, False
+    if full_sections.get(docente_materia_id):
+        raise EnrollmentError("sin_cupo", "No hay cupo disponible en este grupo")
+
+    inscripcion = Inscripcion(alumno_id=alumno_id, docente_materia_id=docente_materia_id, estatus_id=estatus_id)
+    db.add(inscripcion)
+    try:
+        # Unique (alumno, docente_materia) and schedule checks run before the seat is locked
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        if idempotency_key:
+            # A concurrent request with the same key may have just committed
+            inscripcion_id = _by_idempotency_key(db, idempotency_key, alumno_id, docente_materia_id)
+            if inscripcion_id is not None:
+                return inscripcion_id, False
+        inscripcion = _reactivate(db, alumno_id, docente_materia_id, estatus_id)
+        if inscripcion is None:
+            # The insert also fails on the foreign keys: tell a missing section from a duplicate
+            state = _section_state(db, docente_materia_id)
+            if state is None or not state.activo:
+                raise EnrollmentError("no_encontrado", "Grupo no encontrado")
+            if db.execute(select(Inscripcion.id).where(
+                Inscripcion.alumno_id == alumno_id, Inscripcion.docente_materia_id == docente_materia_id
+            )).first() is None:
+                raise
+            raise EnrollmentError("ya_inscrito", "El alumno ya está inscrito en este grupo")
+    except Exception:
+        db.rollback()
+        raise
+
+    if not reserve_seat(db, DocenteMateria, docente_materia_id):
+        db.rollback()
+        state = _section_state(db, docente_materia_id)
+        if state is None or not state.activo:
+            raise EnrollmentError("no_encontrado", "Grupo no encontrado")
+        full_sections.set(docente_materia_id, True)
+        raise EnrollmentError("sin_cupo", "No hay cupo disponible en este grupo")
+    grupo_id = db.execute(select(DocenteMateria.grupo_id).where(DocenteMateria.id == docente_materia_id)).scalar()
+    if grupo_id is not None and not reserve_seat(db, Grupo, grupo_id):
+        db.rollback()
+        _section_state(db, docente_materia_id)
+        if not db.execute(select(Grupo.activo).where(Grupo.id == grupo_id)).scalar():
+            raise EnrollmentError("no_encontrado", "Grupo no encontrado")
+        raise EnrollmentError("sin_cupo", "No hay cupo disponible en este grupo")
+
+    inscripcion_id = inscripcion.id
+    if idempotency_key:
+        db.add(InscripcionIdempotencia(
+            clave=idempotency_key, alumno_id=alumno_id,
+            docente_materia_id=docente_materia_id, inscripcion_id=inscripcion_id
+        ))
+    _section_state(db, docente_materia_id)
+    try:
+        db.commit()
+    except IntegrityError:
+        # The key was taken by a concurrent request for another section
+        db.rollback()
+        _section_state(db, docente_materia_id)
+        if not idempotency_key:
+            raise
+        inscripcion_id = _by_idempotency_key(db, idempotency_key, alumno_id, docente_materia_id)
+        if inscripcion_id is None:
+            raise
+        return inscripcion_id, False
+    return inscripcion_id, True
+
+
+def drop(db, alumno_id, inscripcion_id, baja_estatus_id, motivo=None):
+    """Marks the student's enrollment as dropped and frees its seats. Commits. False if not found or already dropped."""
+    result = db.execute(
+        update(Inscripcion)
+        .where(
+            Inscripcion.id == inscripcion_id,
+            Inscripcion.alumno_id == alumno_id,
+            Inscripcion.estatus_id != baja_estatus_id
+        )
+        .values(estatus_id=baja_estatus_id, fecha_baja=func.now(), motivo_baja=motivo)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        return False
+    docente_materia_id, grupo_id = db.execute(
+        select(Inscripcion.docente_materia_id, DocenteMateria.grupo_id)
+        .join(DocenteMateria, DocenteMateria.id == Inscripcion.docente_materia_id)
+        .where(Inscripcion.id == inscripcion_id)
+    ).one()
+    release_seat(db, DocenteMateria, docente_materia_id)
+    if grupo_id is not None:
+        release_seat(db, Grupo, grupo_id)
+    # The Core UPDATE above bypasses the Inscripcion mapper events that bump horario_version
+    _invalidate_alumnos(db.connection(), {alumno_id})
+    full_sections.invalidate(docente_materia_id)
+    _section_state(db, docente_materia_id)
+    db.commit()
+    return True
@@ -0,0 +1,123 @@
+from collections import defaultdict
+import os
+
+from .catalogs import catalogs
+from .database import SessionLocal
+from .jobs import JobQueue
+from .models import (
+    Alumno,
+    Documento,
+    Pago,
+    Periodo,
+    CatConceptosPago,
+    CatEstatusPago,
+    CatTiposDocumento,
+)
+
+# Fee charged to students who are missing required enrollment documents
+CONCEPTO_DOCUMENTOS = "Inscripción Documentos"
+MONTO_DOCUMENTOS = 1000
+
+FEE_JOB_BATCH_SIZE = int(os.getenv("FEE_JOB_BATCH_SIZE", "50"))
+
+
+def _concepto_id(db, nombre):
+    concepto = catalogs.get(CatConceptosPago, db).by_name(nombre)
+    if concepto:
+        return concepto.id
+    nuevo = CatConceptosPago(nombre=nombre, descripcion="Cargo por documentos de inscripción", monto_default=MONTO_DOCUMENTOS, activo=True)
+    db.add(nuevo)
+    db.flush()
+    catalogs.invalidate(CatConceptosPago)
+    return nuevo.id
+
+
+def _estatus_pendiente_id(db):
+    estatus = catalogs.get(CatEstatusPago, db).by_name("Pendiente")
+    if estatus:
+        return estatus.id
+    nuevo = CatEstatusPago(nombre="Pendiente", descripcion="Pago pendiente")
+    db.add(nuevo)
+    db.flush()
+    catalogs.invalidate(CatEstatusPago)
+    return nuevo.id
+
+
+def alumnos_con_documentos_faltantes(db, alumno_ids):
+    required_type_ids = {t.id for t in catalogs.get(CatTiposDocumento, db).filter(activo=True, obligatorio=True)}
+    if not required_type_ids or not alumno_ids:
+        return set()
+    entregados = defaultdict(set)
+    for alumno_id, tipo_id in db.query(Documento.alumno_id, Documento.tipo_id).filter(
+        Documento.alumno_id.in_(alumno_ids),
+        Documento.tipo_id.in_(required_type_ids)
+    ):
+        entregados[alumno_id].add(tipo_id)
+    return {a for a in alumno_ids if required_type_ids - entregados[a]}
+
+
+def reconcile_document_fees(db, alumno_ids):
+    """
+    Makes sure every given student who is still missing required documents has one open
+    (unpaid, pending) documents fee. Safe to run repeatedly; returns the number of charges created.
+    """
+    alumno_ids = sorted(set(alumno_ids))
+    if not alumno_ids:
+        return 0
+    # Lock the students' rows so concurrent reconciliations (other web workers or the batch
+    # script) cannot both decide a charge is missing.
+    db.query(Alumno.id).filter(Alumno.id.in_(alumno_ids)).with_for_update().all()
+
+    faltantes = alumnos_con_documentos_faltantes(db, alumno_ids)
+    if not faltantes:
+        db.commit()
+        return 0
+
+    concepto_id = _concepto_id(db, CONCEPTO_DOCUMENTOS)
+    estatus_id = _estatus_pendiente_id(db)
+    ya_cargados = {alumno_id for (alumno_id,) in db.query(Pago.alumno_id).filter(
+        Pago.alumno_id.in_(faltantes),
+        Pago.concepto_id == concepto_id,
+        Pago.estatus_id == estatus_id,
+        Pago.monto_total == MONTO_DOCUMENTOS,
+        Pago.fecha_pago == None
+    ).distinct()}
+
+    por_cargar = sorted(faltantes - ya_cargados)
+    if por_cargar:
+        periodo = db.query(Periodo.id).order_by(Periodo.fecha_inicio.desc()).first()
+        db.add_all([
+            Pago(
+                alumno_id=alumno_id,
+                periodo_id=periodo.id if periodo else None,
+                concepto_id=concepto_id,
+                monto=MONTO_DOCUMENTOS,
+                descuento_beca=0,
+                otros_descuentos=0,
+                monto_total=MONTO_DOCUMENTOS,
+                monto_pagado=0,
+                estatus_id=estatus_id
+            ) for alumno_id in por_cargar
+        ])
+    db.commit()
+    return len(por_cargar)
+
+
+def _process_fee_batch(payloads):
+    # Payloads are (alumno_id, concepto) tuples; only the documents fee exists today
+    alumno_ids = [alumno_id for alumno_id, concepto in payloads if concepto == CONCEPTO_DOCUMENTOS]
+    db = SessionLocal()
+    try:
+        reconcile_document_fees(db, alumno_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+fee_jobs = JobQueue("fees", _process_fee_batch, batch_size=FEE_JOB_BATCH_SIZE)
+
+
+def schedule_document_fee(alumno_id):
+    return fee_jobs.submit((alumno_id, CONCEPTO_DOCUMENTOS))
@@ -0,0 +1,138 @@
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import case, func, select, update
+
+from .aggregates import apply_kardex_changes, kardex_context
+from .models import CalificacionParcial, DocenteMateria, Inscripcion, Kardex
+
+PASSING_GRADE = 7.0
+
+# Final grade policy
+# A kardex's final grade is the average of its graded partials weighted by
+# CalificacionParcial.porcentaje_peso. Weights are normalized over the graded partials,
+# so a kardex with only some units captured shows its running weighted average. When any
+# graded partial has no weight (or all weights are 0) the plain average is used instead.
+# A kardex without graded partials has no final grade.
+
+
+def final_grade(partials):
+    """`partials` is an iterable of (calificacion, porcentaje_peso) pairs."""
+    graded = [(c, w) for c, w in partials if c is not None]
+    if not graded:
+        return None
+    total_weight = sum(w for _, w in graded if w is not None)
+    if all(w is not None for _, w in graded) and total_weight > 0:
+        return round(sum(c * w for c, w in graded) / total_weight, 2)
+    return round(sum(c for c, _ in graded) / len(graded), 2)
+
+
+def final_grade_expression():
+    """SQL counterpart of final_grade() for one kardex; use inside a query grouped by kardex_id."""
+    c, w = CalificacionParcial.calificacion, CalificacionParcial.porcentaje_peso
+    graded_weight = func.sum(case((c.isnot(None), w)))
+    unweighted = func.sum(case(((c.isnot(None)) & (w.is_(None)), 1), else_=0))
+    return func.round(case(
+        ((unweighted == 0) & (graded_weight > 0), func.sum(c * w) / graded_weight),
+        else_=func.avg(c)
+    ), 2)
+
+
+def _write_finals(db, finals):
+    if not finals:
+        return
+    # Captured before the write so the student aggregates can be moved by the difference
+    context = kardex_context(db, list(finals))
+    results = {kardex_id: (grade, grade >= PASSING_GRADE) for kardex_id, grade in finals.items()}
+    db.execute(update(Kardex), [
+        {"id": kardex_id, "calificacion_final": grade, "aprobado": aprobado}
+        for kardex_id, (grade, aprobado) in results.items()
+    ])
+    apply_kardex_changes(db, context, results)
+
+
+def recompute_kardex_finals(db, kardex_ids):
+    """
+    Incremental path: recomputes the final grade of just the given kardex rows (the ones whose
+    partials changed) with one SELECT and one bulk UPDATE. Does not commit.
+    Returns {kardex_id: calificacion_final} for the rows that were updated.
+    """
+    if not kardex_ids:
+        return {}
+    partials = defaultdict(list)
+    for kardex_id, calificacion, peso in db.query(
+        CalificacionParcial.kardex_id, CalificacionParcial.calificacion, CalificacionParcial.porcentaje_peso
+    ).filter(CalificacionParcial.kardex_id.in_(kardex_ids)):
+        partials[kardex_id].append((calificacion, peso))
+
+    finals = {kardex_id: final_grade(rows) for kardex_id, rows in partials.items()}
+    finals = {kardex_id: grade for kardex_id, grade in finals.items() if grade is not None}
+    _write_finals(db, finals)
+    return finals
+
+
+def vectorized_finals(kardex_ids, calificaciones, pesos):
+    """
+    Batch path: the same policy as final_grade() over parallel arrays with one entry per
+    partial (NaN for NULL). Returns (kardex_ids, finals) for kardex with a graded partial.
+    """
+    kardex_ids = np.asarray(kardex_ids, dtype=np.int64)
+    c = np.asarray(calificaciones, dtype=np.float64)
+    w = np.asarray(pesos, dtype=np.float64)
+    ids, groups = np.unique(kardex_ids, return_inverse=True)
+
+    graded = ~np.isnan(c)
+    weighted = graded & ~np.isnan(w)
+    count = np.bincount(groups, weights=graded, minlength=len(ids))
+    unweighted = np.bincount(groups, weights=graded & np.isnan(w), minlength=len(ids))
+    sum_c = np.bincount(groups, weights=np.where(graded, c, 0.0), minlength=len(ids))
+    sum_w = np.bincount(groups, weights=np.where(weighted, w, 0.0), minlength=len(ids))
+    sum_cw = np.bincount(groups, weights=np.where(weighted, c * w, 0.0), minlength=len(ids))
+
+    has_grades = count > 0
+    use_weights = (unweighted == 0) & (sum_w > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        finals = np.where(use_weights, sum_cw / sum_w, sum_c / count)
+    return ids[has_grades], np.round(finals[has_grades], 2)
+
+
+def recalculate_finals(db, grupo_id=None, periodo_id=None, batch_size=5000, progress=None):
+    """
+    Recomputes every final grade in a grupo and/or periodo (all kardex when neither is given)
+    after a grading policy change. Kardex ids are walked in keyset pages; each page's partials
+    are computed with NumPy, written with one bulk UPDATE and committed. Returns the number of
+    kardex rows updated.
+    """
+    scope = select(Kardex.id)
+    if grupo_id is not None or periodo_id is not None:
+        scope = scope.join(Inscripcion, Inscripcion.id == Kardex.inscripcion_id).join(
+            DocenteMateria, DocenteMateria.id == Inscripcion.docente_materia_id
+        )
+        if grupo_id is not None:
+            scope = scope.where(DocenteMateria.grupo_id == grupo_id)
+        if periodo_id is not None:
+            scope = scope.where(DocenteMateria.periodo_id == periodo_id)
+
+    updated = 0
+    last_id = 0
+    while True:
+        ids = db.execute(scope.where(Kardex.id > last_id).order_by(Kardex.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+        rows = db.execute(select(
+            CalificacionParcial.kardex_id, CalificacionParcial.calificacion, CalificacionParcial.porcentaje_peso
+        ).where(CalificacionParcial.kardex_id.in_(ids))).all()
+        if rows:
+            kardex_ids, calificaciones, pesos = zip(*rows)
+            ids_con_final, finals = vectorized_finals(
+                kardex_ids,
+                [np.nan if v is None else v for v in calificaciones],
+                [np.nan if v is None else v for v in pesos],
+            )
+            _write_finals(db, dict(zip(ids_con_final.tolist(), finals.tolist())))
+            updated += len(ids_con_final)
+        db.commit()
+        last_id = ids[-1]
+        if progress:
+            progress(updated, last_id)
+    return updated
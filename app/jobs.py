@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+import time
+
+
+class JobQueue:
+    """
+    In-process job queue with a single worker thread. Payloads are deduplicated while
+    they wait, and the worker hands them to `handler` in batches of up to `batch_size`
+    (collected for at most `batch_wait` seconds). Handlers must be idempotent: a payload
+    submitted again while its batch is running is queued once more.
+    """
+
+    def __init__(self, name, handler, batch_size=50, batch_wait=0.5):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.submitted = 0
+        self.deduplicated = 0
+        self.processed = 0
+        self.failed_batches = 0
+        self.batches = 0
+
+    def submit(self, payload):
+        with self._lock:
+            if payload in self._pending:
+                self.deduplicated += 1
+                return False
+            self._pending.add(payload)
+            self.submitted += 1
+        self._queue.put(payload)
+        return True
+
+    def _take(self, payload):
+        with self._lock:
+            self._pending.discard(payload)
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=1)
+        except queue.Empty:
+            return []
+        self._take(first)
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                payload = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            self._take(payload)
+            batch.append(payload)
+        return batch
+
+    def run_once(self, batch):
+        try:
+            self.handler(batch)
+            with self._lock:
+                self.processed += len(batch)
+                self.batches += 1
+        except Exception:
+            with self._lock:
+                self.failed_batches += 1
+            logging.exception(f"Job queue '{self.name}' failed processing a batch of {len(batch)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.run_once(batch)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"jobs-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self, drain=True, timeout=10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if drain:
+            # Flush whatever is still waiting so shutdown does not drop work
+            batch = []
+            while True:
+                try:
+                    payload = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._take(payload)
+                batch.append(payload)
+            for start in range(0, len(batch), self.batch_size):
+                self.run_once(batch[start:start + self.batch_size])
+
+    def status(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "processed": self.processed,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+            }
@@ -0,0 +1,110 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload, selectinload
+
+from .database import Base
+
+
+# ------------------------------------------------------------------
+# Loader strategies
+# Joining a one-to-many collection repeats every parent row once per child, and chaining
+# several of them multiplies the result set that SQLAlchemy then de-duplicates in Python.
+# `eager` joins scalar (many-to-one / one-to-one) hops and loads collections with a
+# separate SELECT ... WHERE parent_id IN (...), so each row comes back exactly once.
+# ------------------------------------------------------------------
+
+def _strategy(attribute):
+    return selectinload if attribute.property.uselist else joinedload
+
+
+def eager(*path):
+    # eager(Inscripcion.kardex, Kardex.calificaciones_parciales) -> joinedload(...).selectinload(...)
+    loader = None
+    for attribute in path:
+        strategy = _strategy(attribute)
+        loader = strategy(attribute) if loader is None else getattr(loader, strategy.__name__)(attribute)
+    return loader
+
+
+# ------------------------------------------------------------------
+# Row amplification metrics
+# Rows fetched are counted per cursor execution on every engine (sync, async and replicas);
+# objects are ORM instances materialized from those rows. Both are attributed to the
+# request currently being served through a context variable.
+# ------------------------------------------------------------------
+
+class LoadStats:
+    __slots__ = ("queries", "rows", "objects")
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.objects = 0
+
+    @property
+    def amplification(self):
+        return round(self.rows / self.objects, 3) if self.objects else 0.0
+
+
+_current_stats = ContextVar("load_stats", default=None)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_rows(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    # Only statements that return rows; PyMySQL/aiomysql buffer them, so rowcount is exact
+    if stats is None or cursor.description is None:
+        return
+    stats.queries += 1
+    if cursor.rowcount and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+@event.listens_for(Base, "load", propagate=True)
+def _count_object(target, context):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.objects += 1
+
+
+@contextmanager
+def track_loading():
+    stats = LoadStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class LoadingMetrics:
+    """Per-route totals of queries, rows fetched and ORM objects returned."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, stats):
+        with self._lock:
+            totals = self._routes.setdefault(route, {"requests": 0, "queries": 0, "rows": 0, "objects": 0})
+            totals["requests"] += 1
+            totals["queries"] += stats.queries
+            totals["rows"] += stats.rows
+            totals["objects"] += stats.objects
+
+    def status(self):
+        with self._lock:
+            return {
+                route: dict(
+                    totals,
+                    rows_per_object=round(totals["rows"] / totals["objects"], 3) if totals["objects"] else 0.0
+                )
+                for route, totals in self._routes.items()
+            }
+
+
+loading_metrics = LoadingMetrics()
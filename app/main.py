@@ -1,18 +1,23 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, File, UploadFile
+from fastapi import FastAPI, Depends, HTTPException, status, Request, File, UploadFile, Header
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 from sqlalchemy.orm import Session, joinedload
-from typing import List, Dict
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
 from collections import defaultdict
-from sqlalchemy import func
+from sqlalchemy import func, select, update
 import traceback
 import logging
-import shutil
 from datetime import date as date_module, date  # Import date
 
 ##This is a random comment to force redeploy
 
-from .database import SessionLocal, engine, Base
+from .database import (
+    SessionLocal, AsyncSessionLocal, engine, Base, pool_status, check_database,
+    create_readonly_session, create_async_readonly_session, replica_router
+)
 from .models import (
     Carrera as DBCarrera, 
     Usuario as DBUsuario, 
@@ -31,17 +36,15 @@ from .models import (
     ServicioSocial as DBServicioSocial,
     PracticasProfesionales as DBPracticasProfesionales,
     Asistencia as DBAsistencia,
-    Periodo as DBPeriodo,
     HorarioDetalle as DBHorarioDetalle,
     Solicitud as DBSolicitud,
     TitulacionRequisito as DBTitulacionRequisito,
     AlumnoTitulacion as DBAlumnoTitulacion,
     Pago as DBPago,
-    CatConceptosPago as DBCatConceptosPago,
-    CatEstatusPago as DBCatEstatusPago,
     CatTiposDocumento as DBCatTiposDocumento,
     CatRoles as DBCatRoles,
-    CatEstatusAlumnos as DBCatEstatusAlumnos # Import CatEstatusAlumnos
+    CatEstatusAlumnos as DBCatEstatusAlumnos, # Import CatEstatusAlumnos
+    CatEstatusInscripcion as DBCatEstatusInscripcion
 )
 #Comment to force redeploy
 from .schemas import (
@@ -75,11 +78,29 @@ from .schemas import (
     StudentGradeUpdate,
     AttendanceSaveRequest,
     AttendanceEntry,
-    StudentRegister
+    StudentRegister,
+    Dashboard as SchemaDashboard,
+    Room as SchemaRoom,
+    FreeSlot as SchemaFreeSlot,
+    RoomUtilization as SchemaRoomUtilization,
+    InscripcionCreate as SchemaInscripcionCreate,
+    InscripcionBaja as SchemaInscripcionBaja,
+    SeatAvailability as SchemaSeatAvailability
 )
 
 # 1. UPDATE THIS IMPORT: Add 'get_current_user'
-from .auth import verify_password, create_access_token, get_current_user, get_password_hash
+from .cache import TTLCache
+from .catalogs import catalogs, warm_catalogs
+from .fees import fee_jobs, schedule_document_fee
+from .bulk import upsert
+from .grades import recompute_kardex_finals
+from .schedule import ScheduleConflictError, active_enrollment
+from .rooms import get_room_occupancy, parse_hhmm, room_occupancy_cache
+from .enrollment import EnrollmentError, enroll, drop, full_sections, get_seat_availability, seat_availability_cache
+from .timetable import DIAS_SEMANA, build_horario, lookup_horario, materialize_horario
+from .loading import eager, track_loading, loading_metrics
+from .storage import validate_upload, store_upload, max_bytes_for, StoredFileResponse
+from .auth import verify_password, create_access_token, get_current_user, get_password_hash, hashing_pool, token_cache
 from jose import JWTError, jwt
 import os
 import uuid
@@ -89,7 +110,15 @@ from sqlalchemy.exc import IntegrityError
 SECRET_KEY = os.getenv("SECRET_KEY", "a_default_secret_key_if_not_set")
 ALGORITHM = "HS256"
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(warm_catalogs)
+    fee_jobs.start()
+    yield
+    await run_in_threadpool(fee_jobs.stop)
+
+
+app = FastAPI(lifespan=lifespan)
 
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS")
 allowed_origins = [o.strip() for o in ALLOWED_ORIGINS.split(",")] if ALLOWED_ORIGINS else [
@@ -109,6 +138,20 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def track_row_amplification(request: Request, call_next):
+    # Rows fetched vs. ORM objects returned for this request; totals per route in /health/loading
+    with track_loading() as stats:
+        response = await call_next(request)
+    response.headers["X-DB-Queries"] = str(stats.queries)
+    response.headers["X-DB-Rows"] = str(stats.rows)
+    response.headers["X-DB-Objects"] = str(stats.objects)
+    route = request.scope.get("route")
+    if route is not None:
+        loading_metrics.record(route.path, stats)
+    return response
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -117,6 +160,31 @@ def get_db():
         db.close()
 
 
+# Read-only handlers use this dependency so they can be served by a replica.
+# Anything that writes (or must read its own writes) keeps using get_db.
+def get_db_readonly():
+    db = create_readonly_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Async counterparts for `async def` handlers: they never block the event loop on I/O.
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_db_readonly():
+    # Choosing a replica may probe its lag with a blocking query
+    db = await run_in_threadpool(create_async_readonly_session)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
 @app.post("/login")
 def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     user = db.query(DBUsuario).options(
@@ -147,7 +215,7 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     requires_documents = False
     missing_documents = []
     if role == "student" and user.alumno:
-        required_types = db.query(DBCatTiposDocumento).filter(DBCatTiposDocumento.activo == True, DBCatTiposDocumento.obligatorio == True).all()
+        required_types = catalogs.get(DBCatTiposDocumento).filter(activo=True, obligatorio=True)
         required_type_ids = {t.id for t in required_types}
         existing_docs = db.query(DBDocumento.tipo_id).filter(DBDocumento.alumno_id == user.alumno.id, DBDocumento.tipo_id.in_(required_type_ids)).all()
         existing_type_ids = {tid for (tid,) in existing_docs}
@@ -165,38 +233,8 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     })
 
     if role == "student" and requires_documents and user.alumno:
-        concepto = db.query(DBCatConceptosPago).filter(DBCatConceptosPago.nombre == "Inscripción Documentos").first()
-        if not concepto:
-            concepto = DBCatConceptosPago(nombre="Inscripción Documentos", descripcion="Cargo por documentos de inscripción", monto_default=1000, activo=True)
-            db.add(concepto)
-            db.flush()
-        estatus = db.query(DBCatEstatusPago).filter(DBCatEstatusPago.nombre == "Pendiente").first()
-        if not estatus:
-            estatus = DBCatEstatusPago(nombre="Pendiente", descripcion="Pago pendiente")
-            db.add(estatus)
-            db.flush()
-        periodo = db.query(DBPeriodo).order_by(DBPeriodo.fecha_inicio.desc()).first()
-        existing_pago = db.query(DBPago).filter(
-            DBPago.alumno_id == user.alumno.id,
-            DBPago.concepto_id == concepto.id,
-            DBPago.estatus_id == estatus.id,
-            DBPago.monto_total == 1000,
-            DBPago.fecha_pago == None
-        ).first()
-        if not existing_pago:
-            pago = DBPago(
-                alumno_id=user.alumno.id,
-                periodo_id=periodo.id if periodo else None,
-                concepto_id=concepto.id,
-                monto=1000,
-                descuento_beca=0,
-                otros_descuentos=0,
-                monto_total=1000,
-                monto_pagado=0,
-                estatus_id=estatus.id
-            )
-            db.add(pago)
-            db.commit()
+        # The pending documents fee is reconciled off the request path (see app/fees.py)
+        schedule_document_fee(user.alumno.id)
 
     return {
         "access_token": token,
@@ -219,11 +257,12 @@ def register_student(student_data: StudentRegister, db: Session = Depends(get_db
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CURP already registered")
 
     # Get default student status
-    default_status = db.query(DBCatEstatusAlumnos).filter(DBCatEstatusAlumnos.nombre == "Activo").first()
+    default_status = catalogs.get(DBCatEstatusAlumnos).by_name("Activo")
     if not default_status:
         default_status = DBCatEstatusAlumnos(nombre="Activo", descripcion="Alumno activo", es_baja=False, orden=1)
         db.add(default_status)
         db.flush()
+        catalogs.invalidate(DBCatEstatusAlumnos)
 
     # Create Alumno record
     temp_matricula = f"TEMP-{uuid.uuid4().hex[:12]}"
@@ -246,7 +285,7 @@ def register_student(student_data: StudentRegister, db: Session = Depends(get_db
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error creando alumno: {str(e.orig) if hasattr(e, 'orig') else str(e)}")
 
     # Get student role
-    student_role = db.query(DBCatRoles).filter(DBCatRoles.nombre == "alumno").first()
+    student_role = catalogs.get(DBCatRoles).by_name("alumno")
     if not student_role:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Student role not found in catalog")
 
@@ -286,19 +325,150 @@ def register_student(student_data: StudentRegister, db: Session = Depends(get_db
     }
 
 
+# ------------------------------------------------------------------
+# Student view builders
+# Shared by the individual /me endpoints and by /dashboard/me so that both
+# compose the same payloads from already-loaded rows.
+# ------------------------------------------------------------------
+
+def build_calificacion(inscripcion):
+    if not inscripcion.docente_materia or not inscripcion.docente_materia.materia:
+        return None
+
+    kardex = inscripcion.kardex
+    parcial1, parcial2, parcial3, promedio = None, None, None, None
+    if kardex:
+        parciales = {cp.unidad: cp.calificacion for cp in kardex.calificaciones_parciales}
+        parcial1 = parciales.get(1)
+        parcial2 = parciales.get(2)
+        parcial3 = parciales.get(3)
+        promedio = kardex.calificacion_final
+
+    return SchemaCalificacion(
+        materia=inscripcion.docente_materia.materia,
+        calificacion_parcial1=parcial1,
+        calificacion_parcial2=parcial2,
+        calificacion_parcial3=parcial3,
+        promedio_final=promedio
+    )
+
+
+def build_materia_faltas(inscripcion, total_faltas):
+    materia = inscripcion.docente_materia.materia
+    grupo = inscripcion.docente_materia.grupo
+    if not all([materia, grupo]):
+        return None
+
+    horas_semana = (materia.horas_teoricas or 0) + (materia.horas_practicas or 0)
+    return SchemaMateriaFaltas(
+        id=materia.id,
+        horas_semana=horas_semana,
+        nombre=materia.nombre,
+        semestre=materia.cuatrimestre,
+        grupo=grupo.nombre,
+        faltas_permitidas=materia.faltas_permitidas or 10,
+        total_faltas=total_faltas,
+        horas_teoricas=materia.horas_teoricas or 0,
+        horas_practicas=materia.horas_practicas or 0
+    )
+
+
+def build_pago(pago):
+    return {
+        "estado": pago.estatus.nombre if pago.estatus else "",
+        "ciclo": pago.periodo.nombre if pago.periodo else "",
+        "cargo": pago.monto_total,
+        "abono": pago.monto_pagado,
+        "saldo": pago.monto_total - pago.monto_pagado
+    }
+
+
+def build_documentos(tipos_documento, documentos_alumno):
+    # Create a dictionary for quick lookup of uploaded documents
+    mapa_documentos_alumno = {doc.tipo_id: doc for doc in documentos_alumno}
+
+    documentos_a_mostrar = []
+    for tipo_doc in tipos_documento:
+        doc_alumno = mapa_documentos_alumno.get(tipo_doc.id)
+        documentos_a_mostrar.append({
+            "id": tipo_doc.id,
+            "nombre": tipo_doc.nombre,
+            "entregado": doc_alumno is not None,
+            "observaciones": doc_alumno.comentarios if doc_alumno else None
+        })
+    return documentos_a_mostrar
+
+
+def build_requisito(req, unidades_cubiertas):
+    return {
+        "nombre": req.requisito,
+        "unidades_a_cubrir": req.unidades_requeridas or 0,
+        "tipo_unidad": req.tipo_unidad or "N/A",
+        "unidades_cubiertas": unidades_cubiertas or 0
+    }
+
+
+# Graduation requirement definitions per plan de estudio change a few times a year at most
+REQUISITOS_CACHE_TTL = int(os.getenv("REQUISITOS_CACHE_TTL", "3600"))
+requisitos_cache = TTLCache(REQUISITOS_CACHE_TTL)
+
+
+def load_requisitos_alumno(db: Session, alumno_id):
+    # Returns None when the student does not exist. In the steady state this is a single
+    # query (alumno LEFT JOIN alumno_titulacion); the plan's requirement definitions come
+    # from requisitos_cache and are loaded with one ordered outer join on a miss.
+    progress_rows = db.query(
+        DBAlumno.plan_estudio_id, DBAlumnoTitulacion.requisito_id, DBAlumnoTitulacion.unidades_cubiertas
+    ).outerjoin(
+        DBAlumnoTitulacion, DBAlumnoTitulacion.alumno_id == DBAlumno.id
+    ).filter(DBAlumno.id == alumno_id).all()
+    if not progress_rows:
+        return None
+
+    plan_estudio_id = progress_rows[0].plan_estudio_id
+    definitions = requisitos_cache.get(plan_estudio_id)
+    if definitions is None:
+        # Ordered by (plan_estudio_id, orden) so MySQL can walk idx_titulacion_requisitos_plan_orden
+        joined_rows = db.query(DBTitulacionRequisito, DBAlumnoTitulacion.unidades_cubiertas).outerjoin(
+            DBAlumnoTitulacion,
+            (DBAlumnoTitulacion.requisito_id == DBTitulacionRequisito.id) & (DBAlumnoTitulacion.alumno_id == alumno_id)
+        ).filter(
+            DBTitulacionRequisito.plan_estudio_id == plan_estudio_id
+        ).order_by(DBTitulacionRequisito.orden, DBTitulacionRequisito.id).all()
+        definitions = [(req.id, build_requisito(req, 0)) for req, _ in joined_rows]
+        requisitos_cache.set(plan_estudio_id, definitions)
+        return [build_requisito(req, unidades) for req, unidades in joined_rows]
+
+    cubiertas = {row.requisito_id: row.unidades_cubiertas for row in progress_rows if row.requisito_id is not None}
+    return [dict(definition, unidades_cubiertas=cubiertas.get(requisito_id) or 0) for requisito_id, definition in definitions]
+
+
+def count_faltas_por_inscripcion(db: Session, inscripcion_ids):
+    if not inscripcion_ids:
+        return {}
+    rows = db.query(DBAsistencia.inscripcion_id, func.count(DBAsistencia.id)).filter(
+        DBAsistencia.inscripcion_id.in_(inscripcion_ids),
+        DBAsistencia.presente == False
+    ).group_by(DBAsistencia.inscripcion_id).all()
+    return {inscripcion_id: total for inscripcion_id, total in rows}
+
+
 # ------------------------------------------------------------------
 # DELETE THE "def get_current_user(request: Request)" FUNCTION HERE
 # The import from .auth will handle it automatically now.
 # ------------------------------------------------------------------
 
 @app.get("/alumnos/me", response_model=SchemaAlumno)
-def read_alumnos_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def read_alumnos_me(current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
-    alumno = db.query(DBAlumno).options(
-        joinedload(DBAlumno.plan_estudio).joinedload(DBPlanEstudio.carrera)
-    ).filter(DBAlumno.id == current_user["user_id"]).first()
+    result = await db.execute(
+        select(DBAlumno).options(
+            joinedload(DBAlumno.plan_estudio).joinedload(DBPlanEstudio.carrera)
+        ).where(DBAlumno.id == current_user["user_id"])
+    )
+    alumno = result.scalars().first()
 
     if alumno is None:
         raise HTTPException(status_code=404, detail="Student not found")
@@ -307,7 +477,7 @@ def read_alumnos_me(current_user: Dict = Depends(get_current_user), db: Session
 
 
 @app.get("/extracurriculares/me", response_model=List[SchemaAlumnoExtracurricular])
-def read_alumno_extracurriculares_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def read_alumno_extracurriculares_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
@@ -321,56 +491,44 @@ def read_alumno_extracurriculares_me(current_user: Dict = Depends(get_current_us
     return extracurriculares
 
 @app.get("/calificaciones/me", response_model=List[SchemaCalificacion])
-async def read_alumno_calificaciones_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def read_alumno_calificaciones_me(current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db_readonly)):
     try:
         if current_user.get("role") != "student":
             raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
         alumno_id = current_user["user_id"]
         
-        alumno = db.query(DBAlumno).filter(DBAlumno.id == alumno_id).first()
-        if not alumno:
+        result = await db.execute(select(DBAlumno.cuatrimestre_actual).where(DBAlumno.id == alumno_id))
+        row = result.first()
+        if not row:
             raise HTTPException(status_code=404, detail="Student not found")
-        current_cuatrimestre = alumno.cuatrimestre_actual
-
-        inscripciones = db.query(DBInscripcion).join(DBDocenteMateria).join(DBMateria).filter(
-            DBInscripcion.alumno_id == alumno_id,
-            DBMateria.cuatrimestre == current_cuatrimestre
-        ).options(
-            joinedload(DBInscripcion.kardex).joinedload(DBKardex.calificaciones_parciales),
-            joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.materia),
-            joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.grupo)
-        ).all()
+        current_cuatrimestre = row.cuatrimestre_actual
+
+        result = await db.execute(
+            select(DBInscripcion).join(DBDocenteMateria).join(DBMateria).where(
+                DBInscripcion.alumno_id == alumno_id,
+                DBMateria.cuatrimestre == current_cuatrimestre,
+                active_enrollment()
+            ).options(
+                eager(DBInscripcion.kardex, DBKardex.calificaciones_parciales),
+                eager(DBInscripcion.docente_materia, DBDocenteMateria.materia),
+                eager(DBInscripcion.docente_materia, DBDocenteMateria.grupo)
+            )
+        )
+        inscripciones = result.scalars().all()
 
         if not inscripciones:
             return []
 
         calificaciones_list = []
         for inscripcion in inscripciones:
-            if not inscripcion.docente_materia or not inscripcion.docente_materia.materia:
-                continue
-
-            kardex = inscripcion.kardex
-            
-            parcial1, parcial2, parcial3, promedio = None, None, None, None
-
-            if kardex:
-                parciales = {cp.unidad: cp.calificacion for cp in kardex.calificaciones_parciales}
-                parcial1 = parciales.get(1)
-                parcial2 = parciales.get(2)
-                parcial3 = parciales.get(3)
-                promedio = kardex.calificacion_final
-
-            calificacion_obj = SchemaCalificacion(
-                materia=inscripcion.docente_materia.materia,
-                calificacion_parcial1=parcial1,
-                calificacion_parcial2=parcial2,
-                calificacion_parcial3=parcial3,
-                promedio_final=promedio
-            )
-            calificaciones_list.append(calificacion_obj)
+            calificacion_obj = build_calificacion(inscripcion)
+            if calificacion_obj is not None:
+                calificaciones_list.append(calificacion_obj)
 
         return calificaciones_list
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in /calificaciones/me: {traceback.format_exc()}")
         raise HTTPException(
@@ -422,12 +580,57 @@ def read_root():
     return {"message": "Welcome to the ESIIMA API"}
 
 
+@app.get("/health/db")
+def health_db():
+    try:
+        latency_ms = check_database()
+    except Exception as e:
+        logging.error(f"Database health check failed: {e}")
+        return JSONResponse(status_code=503, content={
+            "status": "unavailable",
+            "error": str(e),
+            "pool": pool_status()
+        })
+    return {
+        "status": "ok",
+        "latency_ms": latency_ms,
+        "pool": pool_status(),
+        "replicas": replica_router.status()
+    }
+
+
+@app.get("/health/auth")
+def health_auth():
+    return {"status": "ok", "hashing_pool": hashing_pool.status(), "token_cache": token_cache.status()}
+
+
+@app.get("/health/cache")
+def health_cache():
+    return {
+        "catalogs": catalogs.status(),
+        "requisitos": requisitos_cache.status(),
+        "rooms": room_occupancy_cache.status(),
+        "seats": seat_availability_cache.status(),
+        "full_sections": full_sections.status(),
+    }
+
+
+@app.get("/health/jobs")
+def health_jobs():
+    return {"fees": fee_jobs.status()}
+
+
+@app.get("/health/loading")
+def health_loading():
+    return {"routes": loading_metrics.status()}
+
+
 @app.get("/carreras/", response_model=List[SchemaCarrera])
-def read_carreras(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_carreras(skip: int = 0, limit: int = 100, db: Session = Depends(get_db_readonly)):
     return db.query(DBCarrera).offset(skip).limit(limit).all()
 
 @app.get("/users/me", response_model=SchemaUser)
-def get_user_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_user_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     try:
         user_email = current_user.get("sub")
         if not user_email:
@@ -506,7 +709,7 @@ def update_user_me(user_update: SchemaUserUpdate, current_user: Dict = Depends(g
     return get_user_me(current_user, db)
 
 @app.get("/profesores/me", response_model=List[SchemaProfesor])
-def get_profesores_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_profesores_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
@@ -554,7 +757,7 @@ def create_evaluacion(evaluacion: SchemaEvaluacionCreate, current_user: Dict = D
     return {"message": "Evaluación enviada exitosamente."}
 
 @app.get("/evaluaciones/me")
-def get_evaluaciones_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_evaluaciones_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
@@ -569,56 +772,50 @@ def get_evaluaciones_me(current_user: Dict = Depends(get_current_user), db: Sess
     ]
 
 @app.get("/documentos/me", response_model=List[SchemaDocumento])
-def get_documentos_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_documentos_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
     alumno_id = current_user["user_id"]
     
     # Get all document types from the catalog
-    tipos_documento = db.query(DBCatTiposDocumento).filter(DBCatTiposDocumento.activo == True).all()
+    tipos_documento = catalogs.get(DBCatTiposDocumento).filter(activo=True)
     
     # Get all documents uploaded by the student
     documentos_alumno = db.query(DBDocumento).filter(DBDocumento.alumno_id == alumno_id).all()
-    
-    # Create a dictionary for quick lookup of uploaded documents
-    mapa_documentos_alumno = {doc.tipo_id: doc for doc in documentos_alumno}
-    
-    # Prepare the response
-    documentos_a_mostrar = []
-    for tipo_doc in tipos_documento:
-        doc_alumno = mapa_documentos_alumno.get(tipo_doc.id)
-        documentos_a_mostrar.append({
-            "id": tipo_doc.id,
-            "nombre": tipo_doc.nombre,
-            "entregado": doc_alumno is not None,
-            "observaciones": doc_alumno.comentarios if doc_alumno else None
-        })
-        
-    return documentos_a_mostrar
+
+    return build_documentos(tipos_documento, documentos_alumno)
 
 @app.post("/documentos/{doc_id}/upload")
-async def upload_document(doc_id: int, file: UploadFile = File(...), current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def upload_document(doc_id: int, request: Request, file: UploadFile = File(...), current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
     alumno_id = current_user["user_id"]
-    
-    # Check if a document of this type already exists for the student
-    doc = db.query(DBDocumento).filter(DBDocumento.tipo_id == doc_id, DBDocumento.alumno_id == alumno_id).first()
 
-    upload_dir = "uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, file.filename)
+    # A catalog miss reloads with a blocking query, so it runs in the threadpool
+    tipos = await run_in_threadpool(catalogs.get, DBCatTiposDocumento)
+    tipo = tipos.get(doc_id)
+    if not tipo:
+        raise HTTPException(status_code=404, detail="Document type not found")
+
+    content_length = request.headers.get("content-length")
+    validate_upload(tipo, file.filename, int(content_length) if content_length and content_length.isdigit() else None)
+
+    # Check if a document of this type already exists for the student
+    result = await db.execute(
+        select(DBDocumento).where(DBDocumento.tipo_id == doc_id, DBDocumento.alumno_id == alumno_id)
+    )
+    doc = result.scalars().first()
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    stored = await store_upload(file, max_bytes_for(tipo))
+    file_path = stored.path
 
     if doc:
         # Update existing document
         doc.ruta_archivo = file_path
         doc.nombre_archivo = file.filename
-        doc.tamano_bytes = file.file.tell()
+        doc.tamano_bytes = stored.size
         doc.mime_type = file.content_type
         doc.fecha_subida = func.now()
         doc.estatus_id = 1 # Assuming 1 is "Uploaded"
@@ -629,25 +826,55 @@ async def upload_document(doc_id: int, file: UploadFile = File(...), current_use
             tipo_id=doc_id,
             nombre_archivo=file.filename,
             ruta_archivo=file_path,
-            tamano_bytes=file.file.tell(),
+            tamano_bytes=stored.size,
             mime_type=file.content_type,
             estatus_id=1 # Assuming 1 is "Uploaded"
         )
         db.add(doc)
 
-    db.commit()
+    await db.commit()
 
     return {"message": "Document uploaded successfully"}
 
+@app.get("/documentos/{documento_id}/download")
+async def download_document(documento_id: int, request: Request, current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db_readonly)):
+    result = await db.execute(select(DBDocumento).where(DBDocumento.id == documento_id))
+    doc = result.scalars().first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    role = current_user.get("role")
+    if role == "student":
+        if doc.alumno_id != current_user["user_id"]:
+            raise HTTPException(status_code=403, detail="Access denied: Document belongs to another student")
+    elif role == "teacher":
+        # Teachers only see documents of students enrolled in one of their classes
+        teaches_student = await db.execute(
+            select(DBInscripcion.id).join(DBDocenteMateria, DBDocenteMateria.id == DBInscripcion.docente_materia_id).where(
+                DBInscripcion.alumno_id == doc.alumno_id,
+                DBDocenteMateria.docente_id == current_user["user_id"]
+            ).limit(1)
+        )
+        if teaches_student.first() is None:
+            raise HTTPException(status_code=403, detail="Access denied: Student is not enrolled in your classes")
+    else:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    if not doc.ruta_archivo or not os.path.isfile(doc.ruta_archivo):
+        raise HTTPException(status_code=404, detail="Stored file not found")
+
+    # Served with Range / If-None-Match support and without reading the file into memory
+    return StoredFileResponse(doc.ruta_archivo, doc.mime_type, doc.nombre_archivo, request.headers)
+
 @app.get("/inscripciones/me", response_model=List[SchemaInscripcion])
-def get_inscripciones_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_inscripciones_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
     alumno_id = current_user["user_id"]
     inscripciones = db.query(DBInscripcion).filter(DBInscripcion.alumno_id == alumno_id).options(
-        joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.materia),
-        joinedload(DBInscripcion.kardex).joinedload(DBKardex.calificaciones_parciales)
+        eager(DBInscripcion.docente_materia, DBDocenteMateria.materia),
+        eager(DBInscripcion.kardex, DBKardex.calificaciones_parciales)
     ).all()
 
     results = []
@@ -665,7 +892,7 @@ def get_inscripciones_me(current_user: Dict = Depends(get_current_user), db: Ses
     return results
 
 @app.get("/serviciosocial/me", response_model=List[SchemaServicioSocial])
-def get_servicio_social_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_servicio_social_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     try:
         if current_user.get("role") != "student":
             raise HTTPException(status_code=403, detail="Access denied: User is not a student")
@@ -688,7 +915,7 @@ def get_servicio_social_me(current_user: Dict = Depends(get_current_user), db: S
         )
 
 @app.get("/practicas/me", response_model=List[SchemaPracticasProfesionales])
-def get_practicas_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_practicas_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
@@ -697,18 +924,21 @@ def get_practicas_me(current_user: Dict = Depends(get_current_user), db: Session
     return practicas
 
 @app.get("/kardex/me", response_model=Dict[str, List[SchemaKardexEntry]])
-def get_kardex_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_kardex_me(current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db_readonly)):
     try:
         if current_user.get("role") != "student":
             raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
         alumno_id = current_user["user_id"]
         
-        inscripciones = db.query(DBInscripcion).filter(DBInscripcion.alumno_id == alumno_id).options(
-            joinedload(DBInscripcion.kardex),
-            joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.materia),
-            joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.periodo)
-        ).all()
+        result = await db.execute(
+            select(DBInscripcion).where(DBInscripcion.alumno_id == alumno_id, active_enrollment()).options(
+                joinedload(DBInscripcion.kardex),
+                joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.materia),
+                joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.periodo)
+            )
+        )
+        inscripciones = result.scalars().all()
 
         kardex_data = defaultdict(list)
         for inscripcion in inscripciones:
@@ -744,6 +974,8 @@ def get_kardex_me(current_user: Dict = Depends(get_current_user), db: Session =
             kardex_data[semestre].append(entry)
 
         return kardex_data
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(traceback.format_exc())
         raise HTTPException(
@@ -752,49 +984,30 @@ def get_kardex_me(current_user: Dict = Depends(get_current_user), db: Session =
         )
 
 @app.get("/materias/me", response_model=List[SchemaMateriaFaltas])
-def get_materias_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_materias_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
     alumno_id = current_user["user_id"]
     
-    inscripciones = db.query(DBInscripcion).filter(DBInscripcion.alumno_id == alumno_id).options(
+    inscripciones = db.query(DBInscripcion).filter(DBInscripcion.alumno_id == alumno_id, active_enrollment()).options(
         joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.materia),
         joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.grupo)
     ).all()
 
+    # One grouped aggregate for every enrollment instead of a COUNT per inscripcion
+    faltas = count_faltas_por_inscripcion(db, [inscripcion.id for inscripcion in inscripciones])
+
     materias_data = []
     for inscripcion in inscripciones:
-        materia = inscripcion.docente_materia.materia
-        grupo = inscripcion.docente_materia.grupo
-
-        if not all([materia, grupo]):
-            continue
-
-        total_faltas = db.query(DBAsistencia).filter(
-            DBAsistencia.inscripcion_id == inscripcion.id,
-            DBAsistencia.presente == False
-        ).count()
-        
-        horas_semana = (materia.horas_teoricas or 0) + (materia.horas_practicas or 0)
-
-        entry = SchemaMateriaFaltas(
-            id=materia.id,
-            horas_semana=horas_semana,
-            nombre=materia.nombre,
-            semestre=materia.cuatrimestre,
-            grupo=grupo.nombre,
-            faltas_permitidas=materia.faltas_permitidas or 10,
-            total_faltas=total_faltas,
-            horas_teoricas=materia.horas_teoricas or 0,
-            horas_practicas=materia.horas_practicas or 0
-        )
-        materias_data.append(entry)
+        entry = build_materia_faltas(inscripcion, faltas.get(inscripcion.id, 0))
+        if entry is not None:
+            materias_data.append(entry)
 
     return materias_data
 
 @app.get("/faltas/me/{materia_id}", response_model=List[SchemaFaltaDetalle])
-def get_faltas_me(materia_id: int, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_faltas_me(materia_id: int, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
@@ -809,7 +1022,7 @@ def get_faltas_me(materia_id: int, current_user: Dict = Depends(get_current_user
     return faltas
 
 @app.get("/examenes/me", response_model=List[SchemaExamen])
-def get_examenes_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_examenes_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
@@ -866,40 +1079,25 @@ def get_examenes_me(current_user: Dict = Depends(get_current_user), db: Session
     return examenes
 
 @app.get("/horario/me", response_model=Dict[str, Dict[str, str]])
-def get_horario_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_horario_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
     alumno_id = current_user["user_id"]
-    
-    alumno = db.query(DBAlumno).filter(DBAlumno.id == alumno_id).first()
-    if not alumno:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    current_cuatrimestre = alumno.cuatrimestre_actual
 
-    horarios = db.query(DBHorarioDetalle).join(DBDocenteMateria).join(DBInscripcion).join(DBMateria).filter(
-        DBInscripcion.alumno_id == alumno_id,
-        DBMateria.cuatrimestre == current_cuatrimestre
-    ).options(
-        joinedload(DBHorarioDetalle.docente_materia).joinedload(DBDocenteMateria.materia)
-    ).all()
-
-    horario_data = defaultdict(dict)
-    dias_semana = ["LUNES", "MARTES", "MIERCOLES", "JUEVES", "VIERNES", "SABADO"]
+    found, current_cuatrimestre, grid = lookup_horario(db, alumno_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="Student not found")
 
-    for detalle in horarios:
-        hora_inicio = detalle.horario_inicio.strftime("%H:%M")
-        hora_fin = detalle.horario_fin.strftime("%H:%M")
-        dia = dias_semana[detalle.dia_semana - 1]
-        materia = detalle.docente_materia.materia.nombre
-        
-        horario_data[f"{hora_inicio} - {hora_fin}"][dia] = materia
+    if grid is None:
+        # Rebuilt from the primary so an invalidation is never undone with lagging replica data
+        with SessionLocal() as primary:
+            grid = materialize_horario(primary, alumno_id, current_cuatrimestre)
 
-    return horario_data
+    return Response(content=grid, media_type="application/json")
 
 @app.get("/materias/no-aprobadas", response_model=List[SchemaMateriaNoAprobada])
-def get_materias_no_aprobadas(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_materias_no_aprobadas(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
@@ -936,33 +1134,15 @@ def create_solicitud(solicitud: SchemaSolicitudCreate, current_user: Dict = Depe
     return {"message": "Solicitud enviada exitosamente."}
 
 @app.get("/requisitos/me", response_model=List[SchemaRequisitoTitulacion])
-def get_requisitos_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_requisitos_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
     alumno_id = current_user["user_id"]
-    
-    alumno = db.query(DBAlumno).filter(DBAlumno.id == alumno_id).first()
-    if not alumno:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    requisitos = db.query(DBTitulacionRequisito).filter(
-        DBTitulacionRequisito.plan_estudio_id == alumno.plan_estudio_id
-    ).all()
 
-    results = []
-    for req in requisitos:
-        alumno_req = db.query(DBAlumnoTitulacion).filter(
-            DBAlumnoTitulacion.alumno_id == alumno_id,
-            DBAlumnoTitulacion.requisito_id == req.id
-        ).first()
-
-        results.append({
-            "nombre": req.requisito,
-            "unidades_a_cubrir": req.unidades_requeridas or 0,
-            "tipo_unidad": req.tipo_unidad or "N/A",
-            "unidades_cubiertas": (alumno_req.unidades_cubiertas or 0) if alumno_req else 0
-        })
+    results = load_requisitos_alumno(db, alumno_id)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Student not found")
 
     return results
 
@@ -970,7 +1150,7 @@ def get_requisitos_me(current_user: Dict = Depends(get_current_user), db: Sessio
 def get_partial_grades_for_materia(
     materia_id: int,
     current_user: Dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db_readonly)
 ):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
@@ -999,28 +1179,101 @@ def get_partial_grades_for_materia(
     return partial_grades
 
 @app.get("/pagos/me", response_model=List[SchemaPago])
-def get_pagos_me(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_pagos_me(current_user: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db_readonly)):
     if current_user.get("role") != "student":
         raise HTTPException(status_code=403, detail="Access denied: User is not a student")
 
     alumno_id = current_user["user_id"]
-    pagos = db.query(DBPago).filter(DBPago.alumno_id == alumno_id).options(
-        joinedload(DBPago.estatus),
-        joinedload(DBPago.periodo)
-    ).all()
+    result = await db.execute(
+        select(DBPago).where(DBPago.alumno_id == alumno_id).options(
+            joinedload(DBPago.estatus),
+            joinedload(DBPago.periodo)
+        )
+    )
+    pagos = result.scalars().all()
 
     if not pagos:
         return []
 
-    return [
-        {
-            "estado": pago.estatus.nombre if pago.estatus else "",
-            "ciclo": pago.periodo.nombre if pago.periodo else "",
-            "cargo": pago.monto_total,
-            "abono": pago.monto_pagado,
-            "saldo": pago.monto_total - pago.monto_pagado
-        } for pago in pagos
-    ]
+    return [build_pago(pago) for pago in pagos]
+
+DASHBOARD_SECTIONS = ("alumno", "calificaciones", "materias", "horario", "pagos", "documentos", "requisitos")
+
+
+@app.get("/dashboard/me", response_model=SchemaDashboard, response_model_exclude_unset=True)
+def get_dashboard_me(sections: Optional[str] = None, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
+    # Composes the student dashboard in one round trip. The enrollment graph
+    # (inscripciones -> docente_materia -> materia/grupo, kardex -> parciales) is
+    # loaded once and every section is built from it. `sections` is an optional
+    # comma-separated subset of DASHBOARD_SECTIONS.
+    if current_user.get("role") != "student":
+        raise HTTPException(status_code=403, detail="Access denied: User is not a student")
+
+    if sections:
+        requested = {s.strip() for s in sections.split(",") if s.strip()}
+        unknown = requested - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(sorted(unknown))}")
+    else:
+        requested = set(DASHBOARD_SECTIONS)
+
+    alumno_id = current_user["user_id"]
+    alumno = db.query(DBAlumno).options(
+        joinedload(DBAlumno.plan_estudio).joinedload(DBPlanEstudio.carrera)
+    ).filter(DBAlumno.id == alumno_id).first()
+    if alumno is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    dashboard = {}
+    if "alumno" in requested:
+        dashboard["alumno"] = alumno
+
+    if requested & {"calificaciones", "materias", "horario"}:
+        # Same enrollments as /calificaciones/me, /materias/me and /horario/me: dropped ones are left out
+        inscripciones = db.query(DBInscripcion).filter(DBInscripcion.alumno_id == alumno_id, active_enrollment()).options(
+            joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.materia),
+            joinedload(DBInscripcion.docente_materia).joinedload(DBDocenteMateria.grupo),
+            eager(DBInscripcion.kardex, DBKardex.calificaciones_parciales)
+        ).all()
+        actuales = [
+            i for i in inscripciones
+            if i.docente_materia and i.docente_materia.materia
+            and i.docente_materia.materia.cuatrimestre == alumno.cuatrimestre_actual
+        ]
+
+        if "calificaciones" in requested:
+            dashboard["calificaciones"] = [c for c in (build_calificacion(i) for i in actuales) if c is not None]
+
+        if "materias" in requested:
+            faltas = count_faltas_por_inscripcion(db, [i.id for i in inscripciones])
+            materias = (build_materia_faltas(i, faltas.get(i.id, 0)) for i in inscripciones)
+            dashboard["materias"] = [m for m in materias if m is not None]
+
+        if "horario" in requested:
+            docente_materia_ids = {i.docente_materia_id for i in actuales}
+            horarios = db.query(DBHorarioDetalle).filter(
+                DBHorarioDetalle.docente_materia_id.in_(docente_materia_ids)
+            ).all() if docente_materia_ids else []
+            # docente_materia/materia resolve from the identity map loaded above
+            dashboard["horario"] = build_horario(horarios)
+
+    if "pagos" in requested:
+        pagos = db.query(DBPago).filter(DBPago.alumno_id == alumno_id).options(
+            joinedload(DBPago.estatus),
+            joinedload(DBPago.periodo)
+        ).all()
+        dashboard["pagos"] = [build_pago(pago) for pago in pagos]
+
+    if "documentos" in requested:
+        tipos_documento = catalogs.get(DBCatTiposDocumento).filter(activo=True)
+        documentos_alumno = db.query(DBDocumento).filter(DBDocumento.alumno_id == alumno_id).all()
+        dashboard["documentos"] = build_documentos(tipos_documento, documentos_alumno)
+
+    if "requisitos" in requested:
+        dashboard["requisitos"] = load_requisitos_alumno(db, alumno_id) or []
+
+    return dashboard
+
 
 @app.get("/teacher/groups", response_model=List[TeacherGroup])
 def get_teacher_groups(current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -1080,8 +1333,8 @@ def get_group_grades(group_id: int, current_user: Dict = Depends(get_current_use
     inscripciones = db.query(DBInscripcion).filter(
         DBInscripcion.docente_materia.has(grupo_id=group_id)
     ).options(
-        joinedload(DBInscripcion.alumno),
-        joinedload(DBInscripcion.kardex).joinedload(DBKardex.calificaciones_parciales)
+        eager(DBInscripcion.alumno),
+        eager(DBInscripcion.kardex, DBKardex.calificaciones_parciales)
     ).all()
 
     student_grades = []
@@ -1102,35 +1355,49 @@ def update_group_grades(group_id: int, grades: List[StudentGradeUpdate], current
     if current_user.get("role") != "teacher":
         raise HTTPException(status_code=403, detail="Access denied: User is not a teacher")
 
-    for grade_update in grades:
-        inscripcion = db.query(DBInscripcion).filter(
-            DBInscripcion.alumno_id == grade_update.student_id,
-            DBInscripcion.docente_materia.has(grupo_id=group_id)
-        ).first()
+    if not grades:
+        return
 
-        if not inscripcion:
-            continue
+    # Prefetch every inscripcion of the submitted students in this group in one query.
+    # A student keeps the first (lowest id) inscripcion, as the per-student lookup did.
+    student_ids = {grade_update.student_id for grade_update in grades}
+    inscripcion_por_alumno = {}
+    for inscripcion_id, alumno_id in db.query(DBInscripcion.id, DBInscripcion.alumno_id).join(DBDocenteMateria).filter(
+        DBDocenteMateria.grupo_id == group_id,
+        DBInscripcion.alumno_id.in_(student_ids)
+    ).order_by(DBInscripcion.id):
+        inscripcion_por_alumno.setdefault(alumno_id, inscripcion_id)
+
+    if not inscripcion_por_alumno:
+        return
 
-        kardex = db.query(DBKardex).filter(DBKardex.inscripcion_id == inscripcion.id).first()
-        if not kardex:
-            kardex = DBKardex(inscripcion_id=inscripcion.id, estatus_id=1)
-            db.add(kardex)
-            db.flush()
+    inscripcion_ids = list(inscripcion_por_alumno.values())
+    kardex_por_inscripcion = dict(
+        db.query(DBKardex.inscripcion_id, DBKardex.id).filter(DBKardex.inscripcion_id.in_(inscripcion_ids)).all()
+    )
 
+    # Create the missing kardex rows in one batch
+    nuevos = [DBKardex(inscripcion_id=i, estatus_id=1) for i in inscripcion_ids if i not in kardex_por_inscripcion]
+    if nuevos:
+        db.add_all(nuevos)
+        db.flush()
+        kardex_por_inscripcion.update({k.inscripcion_id: k.id for k in nuevos})
+
+    rows = []
+    for grade_update in grades:
+        inscripcion_id = inscripcion_por_alumno.get(grade_update.student_id)
+        if inscripcion_id is None:
+            continue
+        kardex_id = kardex_por_inscripcion[inscripcion_id]
         for parcial, calificacion in [ (1, grade_update.parcial1), (2, grade_update.parcial2), (3, grade_update.parcial3) ]:
             if calificacion is None:
                 continue
-            
-            calificacion_parcial = db.query(DBCalificacionParcial).filter(
-                DBCalificacionParcial.kardex_id == kardex.id,
-                DBCalificacionParcial.unidad == parcial
-            ).first()
-
-            if calificacion_parcial:
-                calificacion_parcial.calificacion = calificacion
-            else:
-                db.add(DBCalificacionParcial(kardex_id=kardex.id, unidad=parcial, calificacion=calificacion))
+            rows.append({"kardex_id": kardex_id, "unidad": parcial, "calificacion": calificacion})
 
+    # Single INSERT ... ON DUPLICATE KEY UPDATE against uq_calificaciones_parciales_kardex_unidad
+    upsert(db, DBCalificacionParcial, rows, ["kardex_id", "unidad"], ["calificacion"])
+    # Only the kardex rows whose partials were just written get a new weighted final
+    recompute_kardex_finals(db, {row["kardex_id"] for row in rows})
     db.commit()
 
 @app.get("/groups/{group_id}/attendance", response_model=List[AttendanceEntry])
@@ -1152,18 +1419,19 @@ def get_group_attendance(group_id: int, date: str, current_user: Dict = Depends(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
-    inscripciones = db.query(DBInscripcion).filter(
-        DBInscripcion.docente_materia_id == dm.id
-    ).options(joinedload(DBInscripcion.alumno)).all()
+    # All attendance of the docente_materia on that date in one query; newest row per inscripcion wins
+    rows = db.query(DBAsistencia.inscripcion_id, DBInscripcion.alumno_id, DBAsistencia.presente).join(DBInscripcion).filter(
+        DBInscripcion.docente_materia_id == dm.id,
+        DBAsistencia.fecha == query_date
+    ).order_by(DBAsistencia.inscripcion_id, DBAsistencia.created_at.desc(), DBAsistencia.id.desc()).all()
 
     entries: List[AttendanceEntry] = []
-    for inscripcion in inscripciones:
-        asistencia = db.query(DBAsistencia).filter(
-            DBAsistencia.inscripcion_id == inscripcion.id,
-            DBAsistencia.fecha == query_date
-        ).order_by(DBAsistencia.created_at.desc()).first()
-        if asistencia:
-            entries.append(AttendanceEntry(student_id=inscripcion.alumno_id, status="presente" if asistencia.presente else "ausente"))
+    seen = set()
+    for inscripcion_id, alumno_id, presente in rows:
+        if inscripcion_id in seen:
+            continue
+        seen.add(inscripcion_id)
+        entries.append(AttendanceEntry(student_id=alumno_id, status="presente" if presente else "ausente"))
 
     return entries
 
@@ -1184,32 +1452,137 @@ def save_group_attendance(group_id: int, payload: AttendanceSaveRequest, current
     horario = db.query(DBHorarioDetalle).filter(DBHorarioDetalle.docente_materia_id == dm.id).first()
     horario_id = horario.id if horario else None
 
+    inscripcion_por_alumno = dict(
+        db.query(DBInscripcion.alumno_id, DBInscripcion.id).filter(DBInscripcion.docente_materia_id == dm.id).all()
+    )
+
+    # Latest existing row per inscripcion for that date, fetched in one query
+    asistencia_por_inscripcion = {}
+    for asistencia_id, inscripcion_id in db.query(DBAsistencia.id, DBAsistencia.inscripcion_id).filter(
+        DBAsistencia.inscripcion_id.in_(inscripcion_por_alumno.values()),
+        DBAsistencia.fecha == payload.date
+    ).order_by(DBAsistencia.inscripcion_id, DBAsistencia.created_at.desc(), DBAsistencia.id.desc()):
+        asistencia_por_inscripcion.setdefault(inscripcion_id, asistencia_id)
+
+    updates = []
+    inserts = []
     for entry in payload.attendance:
-        inscripcion = db.query(DBInscripcion).filter(
-            DBInscripcion.alumno_id == entry.student_id,
-            DBInscripcion.docente_materia_id == dm.id
-        ).first()
-        if not inscripcion:
+        inscripcion_id = inscripcion_por_alumno.get(entry.student_id)
+        if inscripcion_id is None:
             continue
+        presente = entry.status == "presente"
+        asistencia_id = asistencia_por_inscripcion.get(inscripcion_id)
+        if asistencia_id is not None:
+            updates.append({"id": asistencia_id, "presente": presente})
+        else:
+            inserts.append({
+                "inscripcion_id": inscripcion_id,
+                "horario_detalle_id": horario_id,
+                "fecha": payload.date,
+                "presente": presente,
+                "retardo": False,
+                "justificada": False
+            })
+
+    if updates:
+        # Executemany UPDATE by primary key
+        db.execute(update(DBAsistencia), updates)
+    # A concurrent save of the same roll call collides on uq_asistencias_inscripcion_fecha_horario
+    upsert(db, DBAsistencia, inserts, ["inscripcion_id", "fecha", "horario_detalle_id"], ["presente"])
+    db.commit()
+# ------------------------------------------------------------------
+# Room occupancy (see app/rooms.py). dia is 1 (LUNES) .. 6 (SABADO); times are HH:MM.
+# ------------------------------------------------------------------
 
-        asistencia = db.query(DBAsistencia).filter(
-            DBAsistencia.inscripcion_id == inscripcion.id,
-            DBAsistencia.fecha == payload.date
-        ).order_by(DBAsistencia.created_at.desc()).first()
+def parse_room_times(dia, inicio=None, fin=None):
+    if not 1 <= dia <= len(DIAS_SEMANA):
+        raise HTTPException(status_code=400, detail=f"dia must be between 1 and {len(DIAS_SEMANA)}")
+    try:
+        times = [parse_hhmm(t) for t in (inicio, fin) if t is not None]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Times must use the HH:MM format")
+    if len(times) == 2 and times[0] >= times[1]:
+        raise HTTPException(status_code=400, detail="inicio must be before fin")
+    return times
 
-        if asistencia:
-            asistencia.presente = (entry.status == "presente")
-        else:
-            db.add(DBAsistencia(
-                inscripcion_id=inscripcion.id,
-                horario_detalle_id=horario_id,
-                fecha=payload.date,
-                presente=(entry.status == "presente"),
-                retardo=False,
-                justificada=False
-            ))
 
-    db.commit()
+@app.get("/rooms/free", response_model=List[SchemaRoom])
+def get_free_rooms(periodo_id: int, dia: int, inicio: str, fin: str, edificio: Optional[str] = None, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
+    inicio_min, fin_min = parse_room_times(dia, inicio, fin)
+    return get_room_occupancy(periodo_id, db).free_rooms(dia, inicio_min, fin_min, edificio)
+
+
+@app.get("/rooms/free-slots", response_model=List[SchemaFreeSlot])
+def get_room_free_slots(periodo_id: int, edificio: str, aula: str, dia: int, min_minutes: int = 15, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
+    parse_room_times(dia)
+    return get_room_occupancy(periodo_id, db).free_slots(edificio, aula, dia, min_minutes)
+
+
+@app.get("/rooms/utilization", response_model=List[SchemaRoomUtilization])
+def get_room_utilization(periodo_id: int, edificio: Optional[str] = None, dia: Optional[int] = None, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
+    if dia is not None:
+        parse_room_times(dia)
+    return get_room_occupancy(periodo_id, db).utilization(edificio, dia)
+
+
+# ------------------------------------------------------------------
+# Enrollment with seat reservation (see app/enrollment.py). Retries that send the same
+# Idempotency-Key header get the original enrollment back with 200 instead of 201.
+# ------------------------------------------------------------------
+
+ENROLLMENT_ERROR_STATUS = {"sin_cupo": 409, "ya_inscrito": 409, "no_encontrado": 404, "clave_reutilizada": 422}
+
+
+def estatus_inscripcion_id(nombre):
+    estatus = catalogs.get(DBCatEstatusInscripcion).by_name(nombre)
+    if not estatus:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Enrollment status '{nombre}' not found in catalog")
+    return estatus.id
+
+
+@app.post("/inscripciones", status_code=status.HTTP_201_CREATED)
+def create_inscripcion(inscripcion: SchemaInscripcionCreate, response: Response, idempotency_key: Optional[str] = Header(None, max_length=64), current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.get("role") != "student":
+        raise HTTPException(status_code=403, detail="Access denied: User is not a student")
+
+    inscripcion_id, created = enroll(
+        db, current_user["user_id"], inscripcion.docente_materia_id, estatus_inscripcion_id("Inscrito"), idempotency_key
+    )
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    return {"inscripcion_id": inscripcion_id, "message": "Inscripción realizada exitosamente."}
+
+
+@app.post("/inscripciones/{inscripcion_id}/baja")
+def baja_inscripcion(inscripcion_id: int, baja: SchemaInscripcionBaja, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user.get("role") != "student":
+        raise HTTPException(status_code=403, detail="Access denied: User is not a student")
+
+    if not drop(db, current_user["user_id"], inscripcion_id, estatus_inscripcion_id("Baja"), baja.motivo):
+        raise HTTPException(status_code=404, detail="Inscripción no encontrada o ya dada de baja")
+    return {"message": "Baja realizada exitosamente."}
+
+
+@app.get("/inscripciones/disponibilidad", response_model=List[SchemaSeatAvailability])
+def get_disponibilidad(periodo_id: int, current_user: Dict = Depends(get_current_user), db: Session = Depends(get_db_readonly)):
+    return get_seat_availability(periodo_id, db).sections()
+
+
+@app.exception_handler(EnrollmentError)
+async def enrollment_error_handler(request: Request, exc: EnrollmentError):
+    return JSONResponse(status_code=ENROLLMENT_ERROR_STATUS.get(exc.reason, 400), content={
+        "detail": str(exc),
+        "reason": exc.reason
+    })
+
+
+@app.exception_handler(ScheduleConflictError)
+async def schedule_conflict_handler(request: Request, exc: ScheduleConflictError):
+    return JSONResponse(status_code=409, content={
+        "detail": "Schedule conflict",
+        "conflicts": [conflict._asdict() for conflict in exc.conflicts]
+    })
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logging.error(f"Unhandled error: {exc}\n{traceback.format_exc()}")
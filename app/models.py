@@ -1,4 +1,4 @@
-from sqlalchemy import (Column, Integer, String, Boolean, Float, Text, JSON, 
+from sqlalchemy import (Column, Integer, String, Boolean, Float, Numeric, Text, JSON, 
                         ForeignKey, DateTime, Date, Time, Index, UniqueConstraint)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -27,6 +27,10 @@ class Alumno(Base):
     promedio_general = Column(Float, nullable=True)
     creditos_cursados = Column(Integer, default=0)
     creditos_aprobados = Column(Integer, default=0)
+    # Exact sum of creditos * calificacion_final behind promedio_general (app/aggregates.py)
+    puntos_ponderados = Column(Numeric(12, 4), nullable=True)
+    # Bumped whenever the student's timetable changes; horarios_alumno rows of another version are stale
+    horario_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     calle = Column(String(255))
@@ -289,6 +293,8 @@ class DocenteMateria(Base):
     __table_args__ = (
         UniqueConstraint("docente_id", "materia_id", "grupo_id", "periodo_id", name="uq_docente_materia_periodo"),
         Index("idx_docente_materia_grupo_materia_periodo", "grupo_id", "materia_id", "periodo_id"),
+        Index("idx_docente_materia_docente_activo", "docente_id", "activo"),
+        Index("idx_docente_materia_periodo_id", "periodo_id"),
     )
 
 class HorarioDetalle(Base):
@@ -306,6 +312,16 @@ class HorarioDetalle(Base):
         Index("idx_horario_detalle_aula_dia_inicio", "aula", "dia_semana", "horario_inicio"),
     )
 
+class HorarioAlumno(Base):
+    # Read model for /horario/me: the student's weekly grid for one cuatrimestre, pre-serialized as JSON.
+    # A row is only served while its version matches alumnos.horario_version (app/timetable.py)
+    __tablename__ = "horarios_alumno"
+    alumno_id = Column(Integer, ForeignKey("alumnos.id"), primary_key=True)
+    cuatrimestre = Column(Integer, primary_key=True)
+    grid = Column(Text, nullable=False)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    generated_at = Column(DateTime(timezone=True), server_default=func.now())
+
 # ============================================
 # ENROLLMENTS & GRADES
 # ============================================
@@ -331,6 +347,15 @@ class Inscripcion(Base):
         Index("idx_inscripciones_estatus_id", "estatus_id"),
     )
 
+class InscripcionIdempotencia(Base):
+    # Idempotency keys of POST /inscripciones: a retried request returns the enrollment its key created (app/enrollment.py)
+    __tablename__ = "inscripciones_idempotencia"
+    clave = Column(String(64), primary_key=True)
+    alumno_id = Column(Integer, ForeignKey("alumnos.id"), nullable=False)
+    docente_materia_id = Column(Integer, ForeignKey("docente_materia.id"), nullable=False)
+    inscripcion_id = Column(Integer, ForeignKey("inscripciones.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Kardex(Base):
     __tablename__ = "kardex"
     id = Column(Integer, primary_key=True)
@@ -382,6 +407,7 @@ class Asistencia(Base):
     __table_args__ = (
         UniqueConstraint("inscripcion_id", "fecha", "horario_detalle_id", name="uq_asistencias_inscripcion_fecha_horario"),
         Index("idx_asistencias_horario_detalle_fecha", "horario_detalle_id", "fecha"),
+        Index("idx_asistencias_inscripcion_presente", "inscripcion_id", "presente"),
     )
 
 # ============================================
@@ -710,6 +736,7 @@ class Evaluacion(Base):
     profesor = relationship("Docente")
     alumno = relationship("Alumno")
     materia = relationship("Materia")
+    __table_args__ = (Index("idx_evaluaciones_alumno_profesor_materia", "alumno_id", "profesor_id", "materia_id"),)
 
 class Solicitud(Base):
     __tablename__ = 'solicitudes'
@@ -721,3 +748,4 @@ class Solicitud(Base):
 
     alumno = relationship("Alumno")
     materia = relationship("Materia")
+    __table_args__ = (Index("idx_solicitudes_alumno_materia", "alumno_id", "materia_id"),)
@@ -0,0 +1,140 @@
+from collections import defaultdict
+import os
+
+from sqlalchemy import event, select
+
+from .cache import TTLCache
+from .database import SessionLocal
+from .models import DocenteMateria, HorarioDetalle
+
+# Rooms are the distinct (edificio, aula) pairs used by HorarioDetalle. For each periodo a
+# RoomOccupancy holds one integer bitset per room and weekday, bit i meaning the
+# SLOT_MINUTES-long slot starting at i * SLOT_MINUTES after midnight is taken. Classes mark
+# every slot they touch, so "free" answers are never optimistic.
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+# Utilization is measured against the building's opening hours
+ROOMS_DAY_START = os.getenv("ROOMS_DAY_START", "07:00")
+ROOMS_DAY_END = os.getenv("ROOMS_DAY_END", "22:00")
+# Per-worker snapshots; ORM writes to horarios_detalle drop them, other workers refresh on expiry
+ROOM_OCCUPANCY_TTL = int(os.getenv("ROOM_OCCUPANCY_TTL", "60"))
+
+
+def parse_hhmm(value):
+    hours, minutes = value.split(":")
+    total = int(hours) * 60 + int(minutes)
+    if not 0 <= total <= 24 * 60:
+        raise ValueError(f"Invalid time '{value}'")
+    return total
+
+
+def slot_mask(inicio, fin):
+    """Bitset of the slots touched by [inicio, fin) minutes."""
+    first = inicio // SLOT_MINUTES
+    last = -(-fin // SLOT_MINUTES)  # ceiling
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def _free_runs(occupied, first, last):
+    runs, start = [], None
+    for slot in range(first, last):
+        if not occupied >> slot & 1:
+            if start is None:
+                start = slot
+        elif start is not None:
+            runs.append((start, slot))
+            start = None
+    if start is not None:
+        runs.append((start, last))
+    return runs
+
+
+def format_minutes(total):
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+
+class RoomOccupancy:
+    def __init__(self, periodo_id, rooms, occupied):
+        self.periodo_id = periodo_id
+        self.rooms = sorted(rooms)
+        self._occupied = occupied  # (edificio, aula, dia) -> int bitset
+
+    @classmethod
+    def load(cls, db, periodo_id):
+        rooms = {
+            (edificio or "", aula)
+            for edificio, aula in db.execute(
+                select(HorarioDetalle.edificio, HorarioDetalle.aula).where(HorarioDetalle.aula.isnot(None)).distinct()
+            )
+        }
+        occupied = defaultdict(int)
+        for edificio, aula, dia, inicio, fin in db.execute(
+            select(HorarioDetalle.edificio, HorarioDetalle.aula, HorarioDetalle.dia_semana,
+                   HorarioDetalle.horario_inicio, HorarioDetalle.horario_fin)
+            .join(DocenteMateria, DocenteMateria.id == HorarioDetalle.docente_materia_id)
+            .where(DocenteMateria.periodo_id == periodo_id, HorarioDetalle.aula.isnot(None))
+        ):
+            mask = slot_mask(inicio.hour * 60 + inicio.minute, fin.hour * 60 + fin.minute)
+            occupied[(edificio or "", aula, dia)] |= mask
+        return cls(periodo_id, rooms, dict(occupied))
+
+    def _rooms(self, edificio=None):
+        return [r for r in self.rooms if edificio is None or r[0] == edificio]
+
+    def free_rooms(self, dia, inicio, fin, edificio=None):
+        wanted = slot_mask(inicio, fin)
+        return [
+            {"edificio": e, "aula": a}
+            for e, a in self._rooms(edificio)
+            if not self._occupied.get((e, a, dia), 0) & wanted
+        ]
+
+    def free_slots(self, edificio, aula, dia, min_minutes=SLOT_MINUTES):
+        first = parse_hhmm(ROOMS_DAY_START) // SLOT_MINUTES
+        last = parse_hhmm(ROOMS_DAY_END) // SLOT_MINUTES
+        occupied = self._occupied.get((edificio, aula, dia), 0)
+        return [
+            {"inicio": format_minutes(start * SLOT_MINUTES), "fin": format_minutes(end * SLOT_MINUTES)}
+            for start, end in _free_runs(occupied, first, last)
+            if (end - start) * SLOT_MINUTES >= min_minutes
+        ]
+
+    def utilization(self, edificio=None, dia=None):
+        window = slot_mask(parse_hhmm(ROOMS_DAY_START), parse_hhmm(ROOMS_DAY_END))
+        dias = [dia] if dia is not None else range(1, 7)
+        capacity = bin(window).count("1") * len(dias)
+        result = []
+        for e, a in self._rooms(edificio):
+            used = sum(bin(self._occupied.get((e, a, d), 0) & window).count("1") for d in dias)
+            result.append({
+                "edificio": e,
+                "aula": a,
+                "horas_ocupadas": used * SLOT_MINUTES / 60,
+                "utilizacion": round(used / capacity, 4) if capacity else 0.0,
+            })
+        return result
+
+
+room_occupancy_cache = TTLCache(ROOM_OCCUPANCY_TTL, max_size=32)
+
+
+def get_room_occupancy(periodo_id, db=None):
+    occupancy = room_occupancy_cache.get(periodo_id)
+    if occupancy is None:
+        if db is not None:
+            occupancy = RoomOccupancy.load(db, periodo_id)
+        else:
+            with SessionLocal() as session:
+                occupancy = RoomOccupancy.load(session, periodo_id)
+        room_occupancy_cache.set(periodo_id, occupancy)
+    return occupancy
+
+
+def _invalidate_rooms(mapper, connection, target):
+    room_occupancy_cache.invalidate()
+
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(HorarioDetalle, _event, _invalidate_rooms)
@@ -0,0 +1,284 @@
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from itertools import accumulate
+
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from .models import CatEstatusInscripcion, DocenteMateria, HorarioDetalle, Inscripcion
+
+# A conflict between two time slots that share a resource on the same day.
+# kind is "docente", "aula" or "alumno"; resource identifies the teacher, room or student.
+Conflict = namedtuple("Conflict", "kind resource dia_semana horario_id other_horario_id")
+Slot = namedtuple("Slot", "horario_id docente_materia_id docente_id dia_semana inicio fin aula edificio")
+# Dropped enrollments keep their row but no longer occupy the student's time
+ESTATUS_BAJA = "Baja"
+
+
+class ScheduleConflictError(ValueError):
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"{len(conflicts)} schedule conflict(s)")
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+class IntervalIndex:
+    """
+    Half-open [inicio, fin) intervals grouped by key. Per key the intervals are kept sorted by
+    start with a running maximum of their ends, so "does anything overlap [s, e)?" is one
+    binary search plus one comparison, and listing the k overlaps costs O(log n + k).
+    """
+
+    def __init__(self):
+        self._pending = defaultdict(list)
+        self._built = {}
+
+    def add(self, key, inicio, fin, ref):
+        self._pending[key].append((inicio, fin, ref))
+        self._built.pop(key, None)
+
+    def _arrays(self, key):
+        arrays = self._built.get(key)
+        if arrays is None:
+            intervals = sorted(self._pending.get(key, ()), key=lambda i: i[0])
+            arrays = (
+                [i[0] for i in intervals],
+                intervals,
+                list(accumulate((i[1] for i in intervals), max)),
+            )
+            self._built[key] = arrays
+        return arrays
+
+    def overlapping(self, key, inicio, fin):
+        starts, intervals, max_ends = self._arrays(key)
+        i = bisect_left(starts, fin) - 1
+        found = []
+        # max_ends is non-decreasing, so once it drops to inicio nothing earlier can overlap
+        while i >= 0 and max_ends[i] > inicio:
+            if intervals[i][1] > inicio:
+                found.append(intervals[i][2])
+            i -= 1
+        return found
+
+    def keys(self):
+        return self._pending.keys()
+
+    def sweep(self, key):
+        """Yields every overlapping (ref, ref) pair of one key in a single pass over its intervals."""
+        _, intervals, _ = self._arrays(key)
+        active = []
+        for inicio, fin, ref in intervals:
+            active = [a for a in active if a[0] > inicio]
+            for _, other in active:
+                yield other, ref
+            active.append((fin, ref))
+
+
+def _resource_keys(slot, alumnos):
+    keys = [("docente", slot.docente_id)]
+    if slot.aula:
+        keys.append(("aula", (slot.edificio or "", slot.aula)))
+    keys.extend(("alumno", alumno_id) for alumno_id in alumnos)
+    return keys
+
+
+def active_enrollment():
+    return Inscripcion.estatus_id.not_in(
+        select(CatEstatusInscripcion.id).where(CatEstatusInscripcion.nombre == ESTATUS_BAJA)
+    )
+
+
+def _load_slots(db, periodo_id, dia_semana=None, extra_filter=None):
+    # Ordered by start so IntervalIndex's sort is a linear pass over presorted input
+    query = select(
+        HorarioDetalle.id, HorarioDetalle.docente_materia_id, DocenteMateria.docente_id,
+        HorarioDetalle.dia_semana, HorarioDetalle.horario_inicio, HorarioDetalle.horario_fin,
+        HorarioDetalle.aula, HorarioDetalle.edificio
+    ).join(DocenteMateria, DocenteMateria.id == HorarioDetalle.docente_materia_id).where(
+        DocenteMateria.periodo_id == periodo_id
+    ).order_by(HorarioDetalle.horario_inicio)
+    if dia_semana is not None:
+        query = query.where(HorarioDetalle.dia_semana == dia_semana)
+    if extra_filter is not None:
+        query = query.where(extra_filter)
+    return [
+        Slot(hid, dm_id, docente_id, dia, to_minutes(inicio), to_minutes(fin), aula, edificio)
+        for hid, dm_id, docente_id, dia, inicio, fin, aula, edificio in db.execute(query)
+    ]
+
+
+def _load_alumnos(db, docente_materia_ids, alumno_ids=None):
+    """{docente_materia_id: [alumno_id]} of the active enrollments, optionally only for `alumno_ids`."""
+    alumnos = defaultdict(list)
+    if docente_materia_ids:
+        enrollments = select(Inscripcion.docente_materia_id, Inscripcion.alumno_id).where(
+            Inscripcion.docente_materia_id.in_(docente_materia_ids), active_enrollment()
+        )
+        if alumno_ids is not None:
+            enrollments = enrollments.where(Inscripcion.alumno_id.in_(alumno_ids))
+        for dm_id, alumno_id in db.execute(enrollments):
+            alumnos[dm_id].append(alumno_id)
+    return alumnos
+
+
+class ScheduleIndex:
+    """Teacher, room and student interval indexes over the HorarioDetalle rows of one periodo."""
+
+    def __init__(self, slots, alumnos_por_docente_materia):
+        self.slots = {slot.horario_id: slot for slot in slots}
+        self.alumnos = alumnos_por_docente_materia
+        self.index = IntervalIndex()
+        for slot in slots:
+            self._add(slot)
+
+    def _add(self, slot):
+        for kind, resource in _resource_keys(slot, self.alumnos.get(slot.docente_materia_id, ())):
+            self.index.add((kind, resource, slot.dia_semana), slot.inicio, slot.fin, slot.horario_id)
+
+    @classmethod
+    def load(cls, db, periodo_id, dia_semana=None, extra_filter=None, alumno_ids=None):
+        slots = _load_slots(db, periodo_id, dia_semana, extra_filter)
+        return cls(slots, _load_alumnos(db, {slot.docente_materia_id for slot in slots}, alumno_ids))
+
+    def conflicts_for(self, slot, alumnos=(), exclude=()):
+        conflicts = []
+        for kind, resource in _resource_keys(slot, alumnos):
+            for other in self.index.overlapping((kind, resource, slot.dia_semana), slot.inicio, slot.fin):
+                if other != slot.horario_id and other not in exclude:
+                    conflicts.append(Conflict(kind, resource, slot.dia_semana, slot.horario_id, other))
+        return conflicts
+
+    def report(self):
+        """Every conflict in the periodo, one sweep per (resource, day)."""
+        return [
+            Conflict(kind, resource, dia, first, second)
+            for kind, resource, dia in self.index.keys()
+            for first, second in self.index.sweep((kind, resource, dia))
+        ]
+
+
+def periodo_conflict_report(db, periodo_id):
+    return ScheduleIndex.load(db, periodo_id).report()
+
+
+# ------------------------------------------------------------------
+# Write validation
+# Before every flush the new or changed HorarioDetalle rows and the new or reactivated
+# enrollments are checked together. Per periodo, the stored slots that can clash with them
+# (same teacher, same room, or sections of the students involved) are loaded once; the
+# pending rows are laid over that snapshot, replacing the stored version of every changed
+# row, so moving or swapping slots within one flush is judged on the final state. Each
+# pending slot is then an O(log n + k) index lookup. Dropped (Baja) enrollments are ignored.
+# A clash raises ScheduleConflictError and nothing is written. Sessions can opt out with
+# session.info["skip_schedule_checks"] = True.
+# ------------------------------------------------------------------
+
+def _docente_materia(db, docente_materia_id, cache):
+    if docente_materia_id not in cache:
+        cache[docente_materia_id] = db.execute(
+            select(DocenteMateria.periodo_id, DocenteMateria.docente_id).where(DocenteMateria.id == docente_materia_id)
+        ).first()
+    return cache[docente_materia_id]
+
+
+def _pending_slot(horario, dm, ref):
+    return Slot(
+        ref, horario.docente_materia_id, dm.docente_id, horario.dia_semana,
+        to_minutes(horario.horario_inicio), to_minutes(horario.horario_fin), horario.aula, horario.edificio
+    )
+
+
+def _check_periodo(db, periodo_id, slots, enrollments, replaced):
+    changed = {slot.docente_materia_id for slot in slots}
+    enrolling = {dm_id for _, dm_id in enrollments}
+    students = {a for alumnos in _load_alumnos(db, changed).values() for a in alumnos}
+    students |= {alumno_id for alumno_id, _ in enrollments}
+
+    clashes = [HorarioDetalle.docente_materia_id.in_(changed | enrolling)]
+    docentes = {slot.docente_id for slot in slots}
+    aulas = {slot.aula for slot in slots if slot.aula}
+    if docentes:
+        clashes.append(DocenteMateria.docente_id.in_(docentes))
+    if aulas:
+        clashes.append(HorarioDetalle.aula.in_(aulas))
+    if students:
+        clashes.append(HorarioDetalle.docente_materia_id.in_(
+            select(Inscripcion.docente_materia_id).where(Inscripcion.alumno_id.in_(students), active_enrollment())
+        ))
+    stored = [
+        slot for slot in _load_slots(db, periodo_id, extra_filter=or_(*clashes))
+        if slot.horario_id not in replaced
+    ]
+    alumnos = _load_alumnos(db, {slot.docente_materia_id for slot in stored} | changed, students)
+    for alumno_id, dm_id in enrollments:
+        alumnos[dm_id].append(alumno_id)
+    index = ScheduleIndex(stored + list(slots), alumnos)
+
+    conflicts, seen = [], set()
+
+    def collect(found):
+        for conflict in found:
+            key = (conflict.kind, conflict.resource, frozenset((conflict.horario_id, conflict.other_horario_id)))
+            if key not in seen:
+                seen.add(key)
+                conflicts.append(conflict)
+
+    for slot in slots:
+        collect(index.conflicts_for(slot, alumnos.get(slot.docente_materia_id, ())))
+    por_seccion = defaultdict(list)
+    for slot in index.slots.values():
+        por_seccion[slot.docente_materia_id].append(slot)
+    for alumno_id, dm_id in enrollments:
+        for slot in por_seccion[dm_id]:
+            collect(c for c in index.conflicts_for(slot, [alumno_id]) if c.kind == "alumno")
+    return conflicts
+
+
+def check_writes(db, horarios=(), inscripciones=()):
+    """Conflicts that the given HorarioDetalle rows and active Inscripciones would create if written together."""
+    dm_cache = {}
+    slots = defaultdict(list)
+    for n, horario in enumerate(horarios):
+        dm = _docente_materia(db, horario.docente_materia_id, dm_cache)
+        if dm is not None:
+            # Rows not inserted yet have no id; they are reported as ("pending", n)
+            slots[dm.periodo_id].append(_pending_slot(horario, dm, horario.id or ("pending", n)))
+    enrollments = defaultdict(list)
+    for inscripcion in inscripciones:
+        dm = _docente_materia(db, inscripcion.docente_materia_id, dm_cache)
+        if dm is not None:
+            enrollments[dm.periodo_id].append((inscripcion.alumno_id, inscripcion.docente_materia_id))
+    replaced = {horario.id for horario in horarios if horario.id is not None}
+    return [
+        conflict
+        for periodo_id in set(slots) | set(enrollments)
+        for conflict in _check_periodo(db, periodo_id, slots[periodo_id], enrollments[periodo_id], replaced)
+    ]
+
+
+@event.listens_for(Session, "before_flush")
+def _check_schedule_writes(session, flush_context, instances):
+    if session.info.get("skip_schedule_checks"):
+        return
+    horarios = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, HorarioDetalle) and (obj in session.new or session.is_modified(obj))
+    ]
+    inscripciones = [obj for obj in session.new if isinstance(obj, Inscripcion)]
+    inscripciones += [
+        obj for obj in session.dirty
+        if isinstance(obj, Inscripcion) and inspect(obj).attrs.estatus_id.history.has_changes()
+    ]
+    if inscripciones:
+        baja_id = session.execute(
+            select(CatEstatusInscripcion.id).where(CatEstatusInscripcion.nombre == ESTATUS_BAJA)
+        ).scalar()
+        inscripciones = [obj for obj in inscripciones if obj.estatus_id != baja_id]
+    if not horarios and not inscripciones:
+        return
+    conflicts = check_writes(session, horarios, inscripciones)
+    if conflicts:
+        raise ScheduleConflictError(conflicts)
@@ -0,0 +1,335 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import os
+import random
+import time
+
+from sqlalchemy import select
+
+from .models import Docente, DocenteMateria, Grupo, HorarioDetalle, Materia
+from .rooms import ROOMS_DAY_END, ROOMS_DAY_START, parse_hhmm, slot_mask
+
+# ------------------------------------------------------------------
+# Timetable generation
+# A course is one (grupo, materia) pair of a periodo. It needs one docente and
+# horas_teoricas + horas_practicas weekly hours, split into blocks of up to BLOCK_MINUTES
+# on different days. Hard constraints: a grupo, a docente and a room are never in two places
+# at once, and a docente only teaches inside their availability. Occupancy is tracked with
+# the 15-minute bitsets of app/rooms.py.
+#
+# The solver is a randomized most-constrained-first construction: courses with the fewest
+# candidate docentes and the most hours are placed first; a course whose blocks cannot all
+# be placed is rolled back and reported as unscheduled. Worker processes run independent
+# restarts with different seeds until the time budget runs out and the placement with the
+# fewest unscheduled hours wins. Re-solving after a change keeps every assignment that the
+# change does not touch fixed and only places the rest.
+# ------------------------------------------------------------------
+
+BLOCK_MINUTES = int(os.getenv("SCHEDULER_BLOCK_MINUTES", "120"))
+START_STEP_MINUTES = 60
+DEFAULT_DAYS = (1, 2, 3, 4, 5)
+
+
+def split_blocks(total_minutes):
+    blocks = []
+    while total_minutes > 0:
+        blocks.append(min(BLOCK_MINUTES, total_minutes))
+        total_minutes -= BLOCK_MINUTES
+    return blocks
+
+
+def load_problem(db, periodo_id, availability=None, rooms=None, days=DEFAULT_DAYS):
+    """
+    Builds the (picklable) scheduling problem for a periodo from the database.
+
+    Courses come from each active grupo's plan/cuatrimestre materias. A course that already
+    has horarios is left alone and only blocks time; one with a DocenteMateria but no horarios
+    keeps its docente. Other courses may use any docente who taught the materia before, or
+    any active docente when nobody has. `availability` maps docente_id -> {dia: [(inicio, fin)
+    minutes]}; docentes without an entry are available during the whole window. `rooms` is a
+    list of (edificio, aula); by default every room that appears in HorarioDetalle.
+    """
+    window = (parse_hhmm(ROOMS_DAY_START), parse_hhmm(ROOMS_DAY_END))
+    grupos = db.execute(select(Grupo).where(Grupo.periodo_id == periodo_id, Grupo.activo == True)).scalars().all()
+    materias_por_plan = defaultdict(list)
+    for materia in db.execute(select(Materia).where(Materia.activo == True)).scalars():
+        materias_por_plan[(materia.plan_estudio_id, materia.cuatrimestre)].append(materia)
+
+    existentes = {
+        (dm.grupo_id, dm.materia_id): dm
+        for dm in db.execute(select(DocenteMateria).where(DocenteMateria.periodo_id == periodo_id)).scalars()
+    }
+    historial = defaultdict(set)
+    for materia_id, docente_id in db.execute(select(DocenteMateria.materia_id, DocenteMateria.docente_id).distinct()):
+        historial[materia_id].add(docente_id)
+    activos = db.execute(select(Docente.id).where(Docente.activo == True)).scalars().all()
+
+    busy = {"grupo": defaultdict(int), "docente": defaultdict(int), "room": defaultdict(int)}
+    programados = set()
+    for grupo_id, materia_id, docente_id, dia, inicio, fin, edificio, aula in db.execute(
+        select(DocenteMateria.grupo_id, DocenteMateria.materia_id, DocenteMateria.docente_id,
+               HorarioDetalle.dia_semana, HorarioDetalle.horario_inicio, HorarioDetalle.horario_fin,
+               HorarioDetalle.edificio, HorarioDetalle.aula)
+        .join(DocenteMateria, DocenteMateria.id == HorarioDetalle.docente_materia_id)
+        .where(DocenteMateria.periodo_id == periodo_id)
+    ):
+        mask = slot_mask(inicio.hour * 60 + inicio.minute, fin.hour * 60 + fin.minute)
+        busy["grupo"][(grupo_id, dia)] |= mask
+        busy["docente"][(docente_id, dia)] |= mask
+        if aula:
+            busy["room"][((edificio or "", aula), dia)] |= mask
+        programados.add((grupo_id, materia_id))
+
+    courses = []
+    for grupo in grupos:
+        for materia in materias_por_plan[(grupo.plan_estudio_id, grupo.cuatrimestre)]:
+            key = (grupo.id, materia.id)
+            minutes = ((materia.horas_teoricas or 0) + (materia.horas_practicas or 0)) * 60
+            if key in programados or minutes <= 0:
+                continue
+            if key in existentes:
+                docentes = [existentes[key].docente_id]
+            else:
+                docentes = sorted(historial.get(materia.id) or activos)
+            courses.append({"key": key, "docentes": docentes, "blocks": split_blocks(minutes)})
+
+    if rooms is None:
+        rooms = sorted({
+            (edificio or "", aula)
+            for edificio, aula in db.execute(
+                select(HorarioDetalle.edificio, HorarioDetalle.aula).where(HorarioDetalle.aula.isnot(None)).distinct()
+            )
+        })
+
+    masks = {}
+    for docente_id, por_dia in (availability or {}).items():
+        masks[docente_id] = {dia: 0 for dia in days}
+        for dia in days:
+            for inicio, fin in por_dia.get(dia, ()):
+                masks[docente_id][dia] |= slot_mask(inicio, fin)
+
+    return {
+        "periodo_id": periodo_id,
+        "courses": courses,
+        "rooms": [tuple(r) for r in rooms],
+        "availability": masks,
+        "busy": {kind: dict(values) for kind, values in busy.items()},
+        "window": window,
+        "days": tuple(days),
+    }
+
+
+def _place_course(problem, course, docente_id, state, rng):
+    grupo_id = course["key"][0]
+    window_start, window_end = problem["window"]
+    available = problem["availability"].get(docente_id)
+    placed = []
+    used_days = set()
+    for block in sorted(course["blocks"], reverse=True):
+        candidates = [
+            (dia, start)
+            for dia in problem["days"] if dia not in used_days
+            for start in range(window_start, window_end - block + 1, START_STEP_MINUTES)
+        ]
+        # Prefer lighter days for the grupo and earlier hours, with random tie-breaking
+        candidates.sort(key=lambda c: (bin(state["grupo"].get((grupo_id, c[0]), 0)).count("1"), c[1], rng.random()))
+        for dia, start in candidates:
+            mask = slot_mask(start, start + block)
+            if state["grupo"].get((grupo_id, dia), 0) & mask or state["docente"].get((docente_id, dia), 0) & mask:
+                continue
+            if available is not None and available.get(dia, 0) & mask != mask:
+                continue
+            room = next((r for r in state["room_order"] if not state["room"].get((r, dia), 0) & mask), None)
+            if room is None and problem["rooms"]:
+                continue
+            session = (dia, start, start + block, room)
+            _mark(state, grupo_id, docente_id, session)
+            placed.append(session)
+            used_days.add(dia)
+            break
+        else:
+            for session in placed:
+                _mark(state, grupo_id, docente_id, session, release=True)
+            return None
+    return placed
+
+
+def _mark(state, grupo_id, docente_id, session, release=False):
+    dia, inicio, fin, room = session
+    mask = slot_mask(inicio, fin)
+    keys = [("grupo", (grupo_id, dia)), ("docente", (docente_id, dia))]
+    if room is not None:
+        keys.append(("room", (room, dia)))
+    for kind, key in keys:
+        if release:
+            state[kind][key] = state[kind].get(key, 0) & ~mask
+        else:
+            state[kind][key] = state[kind].get(key, 0) | mask
+
+
+def solve_once(problem, rng, fixed=None):
+    """One randomized construction. Returns {"assignments": {key: ...}, "unscheduled": [...], "cost": minutes}."""
+    fixed = fixed or {}
+    state = {kind: dict(values) for kind, values in problem["busy"].items()}
+    state["room_order"] = list(problem["rooms"])
+    rng.shuffle(state["room_order"])
+    assignments = {}
+    for key, assignment in fixed.items():
+        for session in assignment["sessions"]:
+            _mark(state, key[0], assignment["docente_id"], session)
+        assignments[key] = assignment
+
+    load = defaultdict(int)
+    pending = [c for c in problem["courses"] if c["key"] not in fixed]
+    pending.sort(key=lambda c: (len(c["docentes"]), -sum(c["blocks"]), rng.random()))
+    unscheduled = []
+    for course in pending:
+        for docente_id in sorted(course["docentes"], key=lambda d: (load[d], rng.random())):
+            sessions = _place_course(problem, course, docente_id, state, rng)
+            if sessions is not None:
+                assignments[course["key"]] = {"docente_id": docente_id, "sessions": sessions}
+                load[docente_id] += sum(course["blocks"])
+                break
+        else:
+            unscheduled.append(course["key"])
+    blocks = {c["key"]: c["blocks"] for c in problem["courses"]}
+    return {
+        "assignments": assignments,
+        "unscheduled": unscheduled,
+        "cost": sum(sum(blocks[key]) for key in unscheduled),
+    }
+
+
+def _solve_worker(problem, seed, deadline, fixed):
+    rng = random.Random(seed)
+    best = None
+    while best is None or (best["cost"] > 0 and time.time() < deadline):
+        result = solve_once(problem, rng, fixed)
+        if best is None or result["cost"] < best["cost"]:
+            best = result
+    return best
+
+
+def generate(problem, workers=None, time_budget=30, fixed=None, seed=None):
+    """Runs restarts in `workers` processes for at most `time_budget` seconds; returns the best placement."""
+    workers = workers or os.cpu_count() or 1
+    deadline = time.time() + time_budget
+    base_seed = random.randrange(1 << 30) if seed is None else seed
+    if workers == 1:
+        return _solve_worker(problem, base_seed, deadline, fixed)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_solve_worker, problem, base_seed + i, deadline, fixed) for i in range(workers)]
+        results = [f.result() for f in futures]
+    return min(results, key=lambda r: r["cost"])
+
+
+def _clashes_with_busy(busy, grupo_id, docente_id, session):
+    dia, inicio, fin, room = session
+    mask = slot_mask(inicio, fin)
+    keys = [("grupo", (grupo_id, dia)), ("docente", (docente_id, dia))]
+    if room is not None:
+        keys.append(("room", (tuple(room), dia)))
+    return any(busy[kind].get(key, 0) & mask for kind, key in keys)
+
+
+def resolve(problem, previous, time_budget=10, workers=None, docentes=(), rooms=(), grupos=()):
+    """
+    Incremental re-solve after a constraint changed for some docentes, rooms or grupos:
+    every previous assignment that does not involve them, still fits the docente's
+    availability and does not clash with what is now stored for the periodo stays fixed,
+    and only the released courses are placed again.
+    """
+    docentes, rooms, grupos = set(docentes), {tuple(r) for r in rooms}, set(grupos)
+    course_keys = {c["key"] for c in problem["courses"]}
+    fixed = {}
+    for key, assignment in previous["assignments"].items():
+        if key not in course_keys or key[0] in grupos or assignment["docente_id"] in docentes:
+            continue
+        if any(session[3] is not None and tuple(session[3]) in rooms for session in assignment["sessions"]):
+            continue
+        available = problem["availability"].get(assignment["docente_id"])
+        if available is not None and any(
+            available.get(dia, 0) & slot_mask(inicio, fin) != slot_mask(inicio, fin)
+            for dia, inicio, fin, _ in assignment["sessions"]
+        ):
+            continue
+        if any(_clashes_with_busy(problem["busy"], key[0], assignment["docente_id"], session)
+               for session in assignment["sessions"]):
+            continue
+        fixed[key] = assignment
+    return generate(problem, workers, time_budget, fixed)
+
+
+def solution_to_json(solution):
+    return {
+        "assignments": [
+            {"grupo_id": grupo_id, "materia_id": materia_id, "docente_id": a["docente_id"],
+             "sessions": [list(session) for session in a["sessions"]]}
+            for (grupo_id, materia_id), a in solution["assignments"].items()
+        ],
+        "unscheduled": [list(key) for key in solution["unscheduled"]],
+        "cost": solution["cost"],
+    }
+
+
+def solution_from_json(data):
+    return {
+        "assignments": {
+            (a["grupo_id"], a["materia_id"]): {
+                "docente_id": a["docente_id"],
+                "sessions": [
+                    (dia, inicio, fin, tuple(room) if room is not None else None)
+                    for dia, inicio, fin, room in a["sessions"]
+                ],
+            }
+            for a in data["assignments"]
+        },
+        "unscheduled": [tuple(key) for key in data.get("unscheduled", ())],
+        "cost": data.get("cost", 0),
+    }
+
+
+def apply_solution(db, problem, solution):
+    """
+    Writes DocenteMateria and HorarioDetalle rows for the solution's new courses. Commits.
+    All horarios go to the database in one flush, so the schedule validation of
+    app/schedule.py checks them together against the periodo's current rows; a solution
+    that no longer fits raises ScheduleConflictError and nothing is written.
+    """
+    periodo_id = problem["periodo_id"]
+    existentes = {
+        (dm.grupo_id, dm.materia_id): dm
+        for dm in db.execute(select(DocenteMateria).where(DocenteMateria.periodo_id == periodo_id)).scalars()
+    }
+    cupos = dict(db.execute(select(Grupo.id, Grupo.cupo_maximo).where(Grupo.periodo_id == periodo_id)).all())
+    nuevos = [
+        DocenteMateria(
+            docente_id=assignment["docente_id"], materia_id=materia_id, grupo_id=grupo_id,
+            periodo_id=periodo_id, cupo_maximo=cupos.get(grupo_id), cupo_actual=0, activo=True
+        )
+        for (grupo_id, materia_id), assignment in solution["assignments"].items()
+        if (grupo_id, materia_id) not in existentes
+    ]
+    db.add_all(nuevos)
+    try:
+        db.flush()
+        existentes.update({(dm.grupo_id, dm.materia_id): dm for dm in nuevos})
+        horarios = []
+        for key, assignment in solution["assignments"].items():
+            for dia, inicio, fin, room in assignment["sessions"]:
+                edificio, aula = room if room is not None else (None, None)
+                horarios.append(HorarioDetalle(
+                    docente_materia_id=existentes[key].id, dia_semana=dia,
+                    horario_inicio=datetime.time(inicio // 60, inicio % 60),
+                    horario_fin=datetime.time(fin // 60, fin % 60),
+                    aula=aula, edificio=edificio or None
+                ))
+        db.add_all(horarios)
+        # Runs check_writes over every new horario before anything is committed
+        db.flush()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(horarios)
@@ -326,3 +326,38 @@ class AttendanceEntry(BaseModel):
 class AttendanceSaveRequest(BaseModel):
     date: date
     attendance: List[AttendanceEntry]
+
+# ===== DASHBOARD =====
+class Dashboard(BaseModel):
+    alumno: Optional[Alumno] = None
+    calificaciones: Optional[List[Calificacion]] = None
+    materias: Optional[List[MateriaFaltas]] = None
+    horario: Optional[Dict[str, Dict[str, str]]] = None
+    pagos: Optional[List[Pago]] = None
+    documentos: Optional[List[Documento]] = None
+    requisitos: Optional[List[RequisitoTitulacion]] = None
+
+# ===== ROOMS =====
+class Room(BaseModel):
+    edificio: str
+    aula: str
+
+class FreeSlot(BaseModel):
+    inicio: str
+    fin: str
+
+class RoomUtilization(Room):
+    horas_ocupadas: float
+    utilizacion: float
+
+class InscripcionCreate(BaseModel):
+    docente_materia_id: int
+
+class InscripcionBaja(BaseModel):
+    motivo: Optional[str] = None
+
+class SeatAvailability(BaseModel):
+    docente_materia_id: int
+    cupo_maximo: Optional[int]
+    cupo_actual: int
+    disponibles: Optional[int]
@@ -0,0 +1,231 @@
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from urllib.parse import quote
+import hashlib
+import os
+import tempfile
+
+# Uploaded documents are stored content-addressed: uploads/<aa>/<bb>/<sha256><ext>.
+# Two students uploading the same file share one copy, and identical original file
+# names can no longer overwrite each other.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+DEFAULT_MAX_MB = 5
+
+# Extensions treated as equivalent when matching CatTiposDocumento.formato_aceptado
+FORMAT_ALIASES = {"jpeg": "jpg", "tif": "tiff"}
+
+
+class StoredFile:
+    def __init__(self, path, sha256, size, deduplicated):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+def _normalize_format(fmt):
+    fmt = fmt.strip().lower().lstrip(".")
+    return FORMAT_ALIASES.get(fmt, fmt)
+
+
+def file_extension(filename):
+    return os.path.splitext(filename or "")[1].lower()
+
+
+def max_bytes_for(tipo):
+    return (tipo.tamano_max_mb or DEFAULT_MAX_MB) * 1024 * 1024
+
+
+def validate_upload(tipo, filename, content_length=None):
+    # Cheap checks done before any of the body is copied to storage
+    if tipo.formato_aceptado:
+        accepted = {_normalize_format(f) for f in tipo.formato_aceptado.split(",") if f.strip()}
+        extension = _normalize_format(file_extension(filename))
+        if extension not in accepted:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Formato no aceptado. Formatos permitidos: {tipo.formato_aceptado}"
+            )
+    # Content-Length covers the whole multipart body, so it is only an upper bound;
+    # the exact size is enforced while copying.
+    if content_length is not None and content_length > max_bytes_for(tipo) + 64 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El archivo excede el tamaño máximo de {tipo.tamano_max_mb or DEFAULT_MAX_MB} MB"
+        )
+
+
+def content_path(sha256, extension):
+    return os.path.join(UPLOAD_DIR, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+
+def _copy_and_hash(source, extension, max_bytes):
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"El archivo excede el tamaño máximo de {max_bytes // (1024 * 1024)} MB"
+                    )
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        sha256 = digest.hexdigest()
+        final_path = content_path(sha256, extension)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            return StoredFile(final_path, sha256, size, deduplicated=True)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        return StoredFile(final_path, sha256, size, deduplicated=False)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+async def store_upload(upload, max_bytes):
+    # The copy runs in the threadpool so disk I/O and hashing never block the event loop
+    return await run_in_threadpool(_copy_and_hash, upload.file, file_extension(upload.filename), max_bytes)
+
+
+# --- Serving stored files ---
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+
+def etag_for(path, stat_result):
+    # Content-addressed files are named after their SHA-256, which makes a strong ETag;
+    # legacy uploads fall back to size/mtime.
+    name = os.path.splitext(os.path.basename(path))[0]
+    if len(name) == 64 and all(c in "0123456789abcdef" for c in name):
+        return f'"{name}"'
+    return f'W/"{stat_result.st_size:x}-{int(stat_result.st_mtime):x}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def parse_range(range_header, size):
+    # Returns (start, end) inclusive for a single satisfiable byte range, None when the
+    # header should be ignored (absent, malformed or multi-range: serve the whole file),
+    # and raises ValueError when the range cannot be satisfied.
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    if size == 0:
+        raise ValueError("Range not satisfiable")
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        if start_text == "" and end_text.isdigit():
+            raise
+        return None
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class StoredFileResponse(Response):
+    """
+    ASGI response for a stored document. Full and single-range bodies are streamed from
+    disk in chunks, so files are never loaded into memory.
+    """
+
+    def __init__(self, path, media_type, filename, request_headers):
+        self.path = path
+        self.media_type = media_type or "application/octet-stream"
+        self.filename = filename
+        self.request_headers = request_headers
+        self.background = None
+
+    def _headers(self, status_code, etag, stat_result, extra):
+        headers = {
+            "etag": etag,
+            "accept-ranges": "bytes",
+            "cache-control": "private, max-age=0, must-revalidate",
+        }
+        if status_code != 304:
+            headers["content-type"] = self.media_type
+            if self.filename:
+                # filename* keeps accented names intact; headers themselves must stay latin-1
+                ascii_name = self.filename.encode("ascii", "ignore").decode().replace('"', "")
+                headers["content-disposition"] = f'inline; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(self.filename)}'
+        headers.update(extra)
+        return [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+
+    async def __call__(self, scope, receive, send):
+        stat_result = await run_in_threadpool(os.stat, self.path)
+        size = stat_result.st_size
+        etag = etag_for(self.path, stat_result)
+
+        if etag_matches(self.request_headers.get("if-none-match"), etag):
+            await send({"type": "http.response.start", "status": 304, "headers": self._headers(304, etag, stat_result, {})})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        range_header = self.request_headers.get("range")
+        if_range = self.request_headers.get("if-range")
+        if if_range and if_range.strip() != etag:
+            # The client's partial copy is stale: send the whole file
+            range_header = None
+
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            await send({"type": "http.response.start", "status": 416,
+                        "headers": self._headers(416, etag, stat_result, {"content-range": f"bytes */{size}", "content-length": "0"})})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if byte_range is None:
+            status_code, start, end, extra = 200, 0, size - 1, {}
+        else:
+            start, end = byte_range
+            status_code, extra = 206, {"content-range": f"bytes {start}-{end}/{size}"}
+        count = end - start + 1 if size else 0
+        extra["content-length"] = str(count)
+
+        await send({"type": "http.response.start", "status": status_code, "headers": self._headers(status_code, etag, stat_result, extra)})
+        if scope.get("method") == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        source = await run_in_threadpool(open, self.path, "rb")
+        try:
+            await run_in_threadpool(source.seek, start)
+            remaining = count
+            while remaining > 0:
+                chunk = await run_in_threadpool(source.read, min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; close the body so the client does not hang
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            source.close()
@@ -0,0 +1,132 @@
+from collections import defaultdict
+import json
+
+from sqlalchemy import delete, event, inspect, select, update
+from sqlalchemy.orm import joinedload
+
+from .bulk import upsert
+from .models import Alumno, DocenteMateria, HorarioAlumno, HorarioDetalle, Inscripcion, Materia
+from .schedule import active_enrollment
+
+DIAS_SEMANA = ["LUNES", "MARTES", "MIERCOLES", "JUEVES", "VIERNES", "SABADO"]
+
+
+def build_horario(horarios):
+    horario_data = defaultdict(dict)
+    for detalle in horarios:
+        hora_inicio = detalle.horario_inicio.strftime("%H:%M")
+        hora_fin = detalle.horario_fin.strftime("%H:%M")
+        dia = DIAS_SEMANA[detalle.dia_semana - 1]
+        materia = detalle.docente_materia.materia.nombre
+
+        horario_data[f"{hora_inicio} - {hora_fin}"][dia] = materia
+    return horario_data
+
+
+# ------------------------------------------------------------------
+# Materialized timetables
+# /horario/me serves horarios_alumno rows: one primary-key lookup returning JSON that is
+# already serialized. A row is only valid while its version equals alumnos.horario_version;
+# otherwise it is rebuilt from the schedule joins and stored with the version read before
+# the rebuild. The mapper events below bump horario_version for every student affected by an
+# ORM write to inscripciones, horarios_detalle, docente_materia or materias, in the same
+# transaction, so a rebuild racing with a change stores a row that is already outdated
+# instead of serving stale data. Bulk Core UPDATE/DELETE statements bypass these events and
+# must bump the version themselves.
+# ------------------------------------------------------------------
+
+def lookup_horario(db, alumno_id):
+    """(found, cuatrimestre_actual, grid JSON or None) with a single query."""
+    row = db.execute(
+        select(Alumno.cuatrimestre_actual, HorarioAlumno.grid).outerjoin(
+            HorarioAlumno,
+            (HorarioAlumno.alumno_id == Alumno.id) & (HorarioAlumno.cuatrimestre == Alumno.cuatrimestre_actual)
+            & (HorarioAlumno.version == Alumno.horario_version)
+        ).where(Alumno.id == alumno_id)
+    ).first()
+    if row is None:
+        return False, None, None
+    return True, row.cuatrimestre_actual, row.grid
+
+
+def materialize_horario(db, alumno_id, cuatrimestre):
+    """
+    Builds the student's grid from the schedule, stores it and returns the JSON. Rows of
+    earlier cuatrimestres are pruned. Commits.
+    """
+    # Read first: the schedule below is at least as new as this version
+    version = db.execute(select(Alumno.horario_version).where(Alumno.id == alumno_id)).scalar() or 0
+    horarios = db.query(HorarioDetalle).join(DocenteMateria).join(Inscripcion).join(Materia).filter(
+        Inscripcion.alumno_id == alumno_id,
+        Materia.cuatrimestre == cuatrimestre,
+        active_enrollment()
+    ).options(
+        joinedload(HorarioDetalle.docente_materia).joinedload(DocenteMateria.materia)
+    ).all()
+    grid = json.dumps(build_horario(horarios), ensure_ascii=False)
+    if cuatrimestre is not None:
+        upsert(db, HorarioAlumno, [{"alumno_id": alumno_id, "cuatrimestre": cuatrimestre, "grid": grid, "version": version}],
+               ["alumno_id", "cuatrimestre"], ["grid", "version"])
+        db.execute(delete(HorarioAlumno).where(
+            HorarioAlumno.alumno_id == alumno_id, HorarioAlumno.cuatrimestre != cuatrimestre
+        ))
+        db.commit()
+    return grid
+
+
+def _bump_versions(connection, alumnos):
+    # updated_at is kept: a timetable change is not an edit of the student record
+    connection.execute(
+        update(Alumno).where(Alumno.id.in_(alumnos))
+        .values(horario_version=Alumno.horario_version + 1, updated_at=Alumno.updated_at)
+    )
+
+
+def _invalidate_alumnos(connection, alumno_ids):
+    alumno_ids = {i for i in alumno_ids if i is not None}
+    if alumno_ids:
+        _bump_versions(connection, alumno_ids)
+
+
+def _invalidate_docente_materias(connection, docente_materia_ids):
+    docente_materia_ids = {i for i in docente_materia_ids if i is not None}
+    if docente_materia_ids:
+        _bump_versions(connection, select(Inscripcion.alumno_id).where(
+            Inscripcion.docente_materia_id.in_(docente_materia_ids)
+        ))
+
+
+def _current_and_previous(target, attribute):
+    history = inspect(target).attrs[attribute].history
+    return {getattr(target, attribute), *history.deleted}
+
+
+def _on_inscripcion_change(mapper, connection, target):
+    _invalidate_alumnos(connection, _current_and_previous(target, "alumno_id"))
+
+
+def _on_horario_detalle_change(mapper, connection, target):
+    _invalidate_docente_materias(connection, _current_and_previous(target, "docente_materia_id"))
+
+
+def _on_docente_materia_change(mapper, connection, target):
+    _invalidate_docente_materias(connection, {target.id})
+
+
+def _on_materia_change(mapper, connection, target):
+    # The grid shows the materia name and is filtered by its cuatrimestre
+    if not (inspect(target).attrs.nombre.history.has_changes() or inspect(target).attrs.cuatrimestre.history.has_changes()):
+        return
+    _invalidate_docente_materias(connection, connection.execute(
+        select(DocenteMateria.id).where(DocenteMateria.materia_id == target.id)
+    ).scalars().all())
+
+
+for _model, _listener in (
+    (Inscripcion, _on_inscripcion_change),
+    (HorarioDetalle, _on_horario_detalle_change),
+    (DocenteMateria, _on_docente_materia_change),
+):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _listener)
+event.listen(Materia, "after_update", _on_materia_change)
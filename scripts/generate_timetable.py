@@ -0,0 +1,103 @@
+import argparse
+import json
+import sys
+import os
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from app.rooms import format_minutes, parse_hhmm
+from app.schedule import periodo_conflict_report
+from app.scheduler import apply_solution, generate, load_problem, resolve, solution_from_json, solution_to_json
+
+DIAS = {1: "LUNES", 2: "MARTES", 3: "MIERCOLES", 4: "JUEVES", 5: "VIERNES", 6: "SABADO"}
+
+def read_availability(path):
+    """
+    Reads docente availability from JSON: {"<docente_id>": {"<dia>": [["07:00", "13:00"], ...]}}.
+    Docentes not listed are available all day.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        int(docente_id): {
+            int(dia): [(parse_hhmm(inicio), parse_hhmm(fin)) for inicio, fin in ranges]
+            for dia, ranges in por_dia.items()
+        }
+        for docente_id, por_dia in data.items()
+    }
+
+def generate_timetable(periodo_id, availability_path=None, workers=None, time_budget=30, output=None,
+                       previous_path=None, changed_docentes=(), changed_rooms=(), changed_grupos=(), apply=False):
+    """
+    Generates a conflict-free timetable for the unscheduled courses of a periodo.
+    With a previous solution only the courses touched by the changed docentes, rooms or
+    grupos are placed again. With apply the result is written to docente_materia/horarios_detalle.
+    Returns the number of courses left unscheduled.
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        availability = read_availability(availability_path) if availability_path else None
+        problem = load_problem(db, periodo_id, availability)
+        print(f"Periodo {periodo_id}: {len(problem['courses'])} course(s) to schedule, "
+              f"{len(problem['rooms'])} room(s), {workers or os.cpu_count()} worker(s), {time_budget}s budget")
+
+        if previous_path:
+            with open(previous_path) as f:
+                previous = solution_from_json(json.load(f))
+            solution = resolve(problem, previous, time_budget, workers,
+                               changed_docentes, changed_rooms, changed_grupos)
+        else:
+            solution = generate(problem, workers, time_budget)
+
+        for (grupo_id, materia_id), assignment in sorted(solution["assignments"].items()):
+            sesiones = ", ".join(
+                f"{DIAS.get(dia, dia)} {format_minutes(inicio)}-{format_minutes(fin)}"
+                + (f" {room[0]} {room[1]}".rstrip() if room else "")
+                for dia, inicio, fin, room in assignment["sessions"]
+            )
+            print(f"grupo {grupo_id} materia {materia_id} docente {assignment['docente_id']}: {sesiones}")
+        for grupo_id, materia_id in solution["unscheduled"]:
+            print(f"UNSCHEDULED grupo {grupo_id} materia {materia_id}")
+        print(f"\n{len(solution['assignments'])} scheduled, {len(solution['unscheduled'])} unscheduled "
+              f"({solution['cost'] / 60:g} weekly hour(s) missing)")
+
+        if output:
+            with open(output, "w") as f:
+                json.dump(solution_to_json(solution), f, indent=2)
+            print(f"Solution written to {output}")
+
+        if apply:
+            created = apply_solution(db, problem, solution)
+            conflicts = periodo_conflict_report(db, periodo_id)
+            print(f"Created {created} horario(s); {len(conflicts)} conflict(s) in the periodo after applying.")
+        return len(solution["unscheduled"])
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a conflict-free timetable for a periodo.")
+    parser.add_argument("periodo_id", type=int)
+    parser.add_argument("--availability", help="JSON file with docente availability")
+    parser.add_argument("--workers", type=int, help="Solver processes (default: CPU count)")
+    parser.add_argument("--time-budget", type=float, default=30, help="Seconds to search for a better timetable")
+    parser.add_argument("--output", help="Write the solution as JSON, for --previous later")
+    parser.add_argument("--previous", help="Previous solution JSON; re-solve only what the changes touch")
+    parser.add_argument("--changed-docente", type=int, action="append", default=[])
+    parser.add_argument("--changed-room", action="append", default=[], help="EDIFICIO:AULA")
+    parser.add_argument("--changed-grupo", type=int, action="append", default=[])
+    parser.add_argument("--apply", action="store_true", help="Write the new horarios to the database")
+    args = parser.parse_args()
+    rooms = [tuple(r.split(":", 1)) if ":" in r else ("", r) for r in args.changed_room]
+    unscheduled = generate_timetable(
+        args.periodo_id, args.availability, args.workers, args.time_budget, args.output,
+        args.previous, args.changed_docente, rooms, args.changed_grupo, args.apply
+    )
+    sys.exit(1 if unscheduled else 0)
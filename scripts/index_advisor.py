@@ -0,0 +1,90 @@
+import sys
+import os
+from sqlalchemy import select, func, text
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from app.models import (
+    Alumno, Asistencia, CalificacionParcial, DocenteMateria, Documento, Evaluacion,
+    HorarioDetalle, Inscripcion, Kardex, Materia, Pago, Solicitud
+)
+
+# EXPLAIN access types that read the whole table or the whole index
+FULL_SCAN_TYPES = {"ALL", "index"}
+
+
+def hot_queries(alumno_id, docente_id, grupo_id):
+    """The filters and joins behind the /me and teacher endpoints, keyed by endpoint."""
+    return {
+        "/calificaciones/me": select(Inscripcion).join(DocenteMateria).join(Materia).where(
+            Inscripcion.alumno_id == alumno_id, Materia.cuatrimestre == 1
+        ),
+        "/calificaciones/me (parciales)": select(CalificacionParcial).join(Kardex).join(Inscripcion).where(
+            Inscripcion.alumno_id == alumno_id
+        ),
+        "/materias/me (faltas)": select(Asistencia.inscripcion_id, func.count(Asistencia.id)).join(Inscripcion).where(
+            Inscripcion.alumno_id == alumno_id, Asistencia.presente == False
+        ).group_by(Asistencia.inscripcion_id),
+        "/horario/me": select(HorarioDetalle).join(DocenteMateria).join(Inscripcion).where(
+            Inscripcion.alumno_id == alumno_id
+        ),
+        "/evaluaciones/me": select(Evaluacion).where(Evaluacion.alumno_id == alumno_id),
+        "/examenes/me (solicitudes)": select(Solicitud.materia_id).where(Solicitud.alumno_id == alumno_id),
+        "/pagos/me": select(Pago).where(Pago.alumno_id == alumno_id),
+        "/documentos/me": select(Documento).where(Documento.alumno_id == alumno_id),
+        "/teacher/groups": select(DocenteMateria).where(
+            DocenteMateria.docente_id == docente_id, DocenteMateria.activo == True
+        ),
+        "/groups/{group_id}/grades": select(Inscripcion, Kardex).join(DocenteMateria).outerjoin(Kardex).where(
+            DocenteMateria.grupo_id == grupo_id
+        ),
+    }
+
+
+def sample_ids(db):
+    alumno_id = db.execute(select(func.min(Alumno.id))).scalar() or 0
+    docente_id, grupo_id = db.execute(
+        select(DocenteMateria.docente_id, DocenteMateria.grupo_id).order_by(DocenteMateria.id).limit(1)
+    ).first() or (0, 0)
+    return alumno_id, docente_id, grupo_id
+
+
+def explain(db, statement):
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    return db.execute(text(f"EXPLAIN {sql}")).mappings().all()
+
+
+def run_index_advisor():
+    """
+    Replays the application's hot queries with EXPLAIN against the configured database
+    and reports every table they read with a full table or full index scan.
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        print("Running index advisor...")
+        findings = 0
+        for endpoint, statement in hot_queries(*sample_ids(db)).items():
+            for row in explain(db, statement):
+                if row["type"] in FULL_SCAN_TYPES:
+                    findings += 1
+                    print(
+                        f"[FULL SCAN] {endpoint}: table '{row['table']}' type={row['type']} "
+                        f"key={row['key']} rows={row['rows']} possible_keys={row['possible_keys']}"
+                    )
+        if findings:
+            print(f"\nIndex advisor finished with {findings} full scan(s).")
+        else:
+            print("\nIndex advisor finished: every hot query uses an index.")
+        return findings
+    except Exception as e:
+        print(f"\nAn error occurred: {e}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(1 if run_index_advisor() else 0)
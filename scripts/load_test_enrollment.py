@@ -0,0 +1,132 @@
+import argparse
+import sys
+import os
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from app.enrollment import EnrollmentError, enroll
+from app.models import Alumno, CatEstatusInscripcion, DocenteMateria, Grupo, Inscripcion, InscripcionIdempotencia
+
+def load_test_enrollment(docente_materia_id, students=1000, threads=50, retries=0.2, cleanup=True, schedule_checks=True):
+    """
+    Fires concurrent enrollments of `students` alumnos into one section through app.enrollment
+    and checks that it was never oversubscribed. A `retries` fraction of the requests is sent
+    twice with the same idempotency key, as a client retrying after a timeout would.
+    Enrollments go through the same schedule conflict validation as the API unless
+    schedule_checks is False, which measures the seat reservation alone.
+    Meant for a staging database: with cleanup the created enrollments are removed and
+    the cupo_actual of the section and its grupo is restored afterwards. Returns True when the seat counts are consistent.
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        section = db.execute(
+            select(DocenteMateria.cupo_maximo, DocenteMateria.cupo_actual, DocenteMateria.grupo_id)
+            .where(DocenteMateria.id == docente_materia_id)
+        ).first()
+        if section is None:
+            print(f"docente_materia {docente_materia_id} not found")
+            return False
+        estatus_id = db.execute(select(CatEstatusInscripcion.id).where(CatEstatusInscripcion.nombre == "Inscrito")).scalar()
+        already = select(Inscripcion.alumno_id).where(Inscripcion.docente_materia_id == docente_materia_id)
+        alumno_ids = db.execute(
+            select(Alumno.id).where(Alumno.id.not_in(already)).order_by(Alumno.id).limit(students)
+        ).scalars().all()
+        before = db.execute(select(func.count(Inscripcion.id)).where(Inscripcion.docente_materia_id == docente_materia_id)).scalar()
+    finally:
+        db.close()
+
+    requests = [(alumno_id, uuid.uuid4().hex) for alumno_id in alumno_ids]
+    requests += requests[:int(len(requests) * retries)]
+    print(f"Enrolling {len(alumno_ids)} alumno(s) ({len(requests)} requests, {threads} threads) into "
+          f"docente_materia {docente_materia_id}: cupo {section.cupo_actual or 0}/{section.cupo_maximo}")
+    print(f"Mode: {'production path (schedule checks on)' if schedule_checks else 'seat reservation only (schedule checks skipped)'}")
+
+    def attempt(request):
+        alumno_id, key = request
+        session = SessionLocal()
+        if not schedule_checks:
+            session.info["skip_schedule_checks"] = True
+        started = time.perf_counter()
+        try:
+            _, created = enroll(session, alumno_id, docente_materia_id, estatus_id, key)
+            outcome = "created" if created else "replayed"
+        except EnrollmentError as e:
+            outcome = e.reason
+        except Exception as e:
+            outcome = type(e).__name__
+        finally:
+            session.close()
+        return outcome, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(attempt, requests))
+    elapsed = time.perf_counter() - started
+
+    outcomes = Counter(outcome for outcome, _ in results)
+    latencies = sorted(latency for _, latency in results)
+    print(f"{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed * 60:,.0f}/min)")
+    if latencies:
+        print(f"latency p50={latencies[len(latencies) // 2] * 1000:.0f}ms "
+              f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.0f}ms")
+    print("outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+
+    db = SessionLocal()
+    try:
+        cupo_actual, cupo_maximo = db.execute(
+            select(DocenteMateria.cupo_actual, DocenteMateria.cupo_maximo).where(DocenteMateria.id == docente_materia_id)
+        ).first()
+        after = db.execute(select(func.count(Inscripcion.id)).where(Inscripcion.docente_materia_id == docente_materia_id)).scalar()
+        created = after - before
+        consistent = (
+            created == outcomes["created"]
+            and (cupo_actual or 0) - (section.cupo_actual or 0) == created
+            and (cupo_maximo is None or (cupo_actual or 0) <= cupo_maximo)
+        )
+        print(f"cupo {cupo_actual}/{cupo_maximo}, {created} new inscripcion(es): {'OK' if consistent else 'INCONSISTENT'}")
+
+        if cleanup and created:
+            nuevas = db.execute(select(Inscripcion.id).where(
+                Inscripcion.docente_materia_id == docente_materia_id, Inscripcion.alumno_id.in_(alumno_ids)
+            )).scalars().all()
+            db.execute(delete(InscripcionIdempotencia).where(InscripcionIdempotencia.inscripcion_id.in_(nuevas)))
+            db.execute(delete(Inscripcion).where(Inscripcion.id.in_(nuevas)))
+            db.execute(update(DocenteMateria).where(DocenteMateria.id == docente_materia_id).values(
+                cupo_actual=DocenteMateria.cupo_actual - len(nuevas)
+            ))
+            if section.grupo_id is not None:
+                db.execute(update(Grupo).where(Grupo.id == section.grupo_id).values(
+                    cupo_actual=Grupo.cupo_actual - len(nuevas)
+                ))
+            db.commit()
+            print(f"Removed the {len(nuevas)} test enrollment(s).")
+        return consistent
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent enrollment load test for one section (staging only).")
+    parser.add_argument("docente_materia_id", type=int)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--retries", type=float, default=0.2, help="Fraction of requests repeated with the same idempotency key")
+    parser.add_argument("--keep", action="store_true", help="Keep the created enrollments")
+    parser.add_argument("--skip-schedule-checks", action="store_true",
+                        help="Measure the seat reservation alone, without the conflict validation real enrollments run")
+    args = parser.parse_args()
+    ok = load_test_enrollment(args.docente_materia_id, args.students, args.threads, args.retries, not args.keep,
+                              not args.skip_schedule_checks)
+    sys.exit(0 if ok else 1)
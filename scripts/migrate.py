@@ -0,0 +1,52 @@
+import argparse
+import sys
+import os
+
+# Add the project root to the Python path to allow for package imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from scripts.migrations.revisions import REVISIONS
+from scripts.migrations.runner import MigrationRunner
+
+
+def main(argv=None):
+    """
+    Versioned schema migrations.
+
+        python scripts/migrate.py                 apply every pending revision
+        python scripts/migrate.py --target 0005   apply pending revisions up to 0005
+        python scripts/migrate.py --dry-run       print the SQL that would run
+        python scripts/migrate.py --status        list revisions and when they were applied
+    """
+    parser = argparse.ArgumentParser(description="Apply versioned database migrations.")
+    parser.add_argument("--target", help="stop after this revision version")
+    parser.add_argument("--dry-run", action="store_true", help="print the pending SQL without executing it")
+    parser.add_argument("--status", action="store_true", help="show applied and pending revisions")
+    parser.add_argument(
+        "--allow-locking", action="store_true",
+        help="run DDL without ALGORITHM=INPLACE, LOCK=NONE (only for changes MySQL cannot do online)"
+    )
+    args = parser.parse_args(argv)
+
+    runner = MigrationRunner(engine, REVISIONS, online=not args.allow_locking)
+    if args.status:
+        for version, description, applied_at in runner.status():
+            print(f"{version}  {'applied ' + str(applied_at) if applied_at else 'pending':<36}  {description}")
+        return 0
+    if args.dry_run:
+        runner.dry_run(args.target)
+        return 0
+
+    print("--- Starting Database Migration ---")
+    try:
+        runner.upgrade(args.target)
+    except Exception as e:
+        print(f"\nAn error occurred: {e}")
+        print("Migration stopped; re-run to resume from the failed revision.")
+        return 1
+    print("\n--- Database Migration Finished ---")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,70 +1,146 @@
+import argparse
+import json
 import sys
 import os
-from sqlalchemy.orm import sessionmaker, joinedload
-from sqlalchemy import func
+import time
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy import func, select, update
 
 # Add the project root to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.database import engine
-from app.models import Kardex, CalificacionParcial
+from app.models import Kardex, CalificacionParcial, Inscripcion, DocenteMateria, Materia
+from app.grades import PASSING_GRADE, final_grade_expression
+from app.aggregates import rebuild_student_aggregates
 
-def populate_kardex_grades():
+BATCH_SIZE = 1000
+DEFAULT_CHECKPOINT = "kardex_grades.checkpoint.json"
+
+
+def _restricted(query, periodo_id, plan_estudio_id):
+    if periodo_id is None and plan_estudio_id is None:
+        return query
+    query = query.join(Inscripcion, Inscripcion.id == Kardex.inscripcion_id).join(
+        DocenteMateria, DocenteMateria.id == Inscripcion.docente_materia_id
+    )
+    if periodo_id is not None:
+        query = query.where(DocenteMateria.periodo_id == periodo_id)
+    if plan_estudio_id is not None:
+        query = query.join(Materia, Materia.id == DocenteMateria.materia_id).where(Materia.plan_estudio_id == plan_estudio_id)
+    return query
+
+
+def _final_grade():
+    # Weighted by porcentaje_peso (see app/grades.py); kardex rows without any graded partial stay NULL
+    return select(final_grade_expression()).where(
+        CalificacionParcial.kardex_id == Kardex.id
+    ).scalar_subquery()
+
+
+def _load_checkpoint(path, filters):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("filters") != filters:
+        print(f"Ignoring checkpoint {path}: it was written for {checkpoint.get('filters')}.")
+        return 0
+    return checkpoint.get("last_id", 0)
+
+
+def _save_checkpoint(path, filters, last_id):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"filters": filters, "last_id": last_id}, f)
+    os.replace(tmp_path, path)
+
+
+def populate_kardex_grades(periodo_id=None, plan_estudio_id=None, batch_size=BATCH_SIZE,
+                           checkpoint_path=DEFAULT_CHECKPOINT, restart=False, rebuild_aggregates=True):
     """
-    Populates or re-populates the calificacion_final and aprobado fields in the Kardex table
-    for ALL entries, by averaging partial grades.
+    Populates or re-populates calificacion_final and aprobado in the Kardex table from the
+    weighted partial grades, optionally only for one periodo and/or plan de estudio.
+
+    Kardex ids are walked in keyset pages of `batch_size`; each page is recomputed with a single
+    UPDATE and committed, and the last committed id is written to `checkpoint_path` so an
+    interrupted run resumes where it stopped. The UPDATEs bypass the incremental student
+    aggregates (app/aggregates.py), so they are rebuilt at the end unless rebuild_aggregates is False.
     """
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     db = SessionLocal()
+    filters = {"periodo_id": periodo_id, "plan_estudio_id": plan_estudio_id}
 
     try:
-        print("Starting migration to populate/re-populate Kardex final grades for all entries...")
-
-        # Fetch ALL Kardex entries
-        kardex_entries_to_update = db.query(Kardex).all()
-
-        if not kardex_entries_to_update:
-            print("No Kardex entries found. Skipping population.")
-            return
-
-        for kardex_entry in kardex_entries_to_update:
-            final_grade = None # Initialize final_grade for each entry
-            
-            # Get associated partial grades
-            partial_grades = db.query(CalificacionParcial).filter(
-                CalificacionParcial.kardex_id == kardex_entry.id
-            ).all()
-
-            if partial_grades:
-                # Calculate average of partial grades
-                valid_grades = [p.calificacion for p in partial_grades if p.calificacion is not None]
-
-                if valid_grades:
-                    final_grade = round(sum(valid_grades) / len(valid_grades), 2)
-                    print(f"Kardex ID {kardex_entry.id}: Calculated final_grade={final_grade} from partials.")
-                else:
-                    # Partial grades exist but are all None
-                    print(f"Kardex ID {kardex_entry.id}: Partial grades exist but are all NULL. Defaulting final_grade to 0.0.")
-                    final_grade = 0.0
-            else:
-                # If no partial grades, default final_grade to 0.0
-                print(f"Kardex ID {kardex_entry.id}: No partial grades found. Defaulting final_grade to 0.0.")
-                final_grade = 0.0
-
-            kardex_entry.calificacion_final = final_grade
-            kardex_entry.aprobado = final_grade is not None and final_grade >= 7.0  # Corrected passing grade to 7.0
-
-            print(f"Updated Kardex ID {kardex_entry.id}: calificacion_final={kardex_entry.calificacion_final}, aprobado={kardex_entry.aprobado}")
-
-        db.commit()
-        print("\nKardex final grades population script finished successfully.")
+        print(f"Starting migration to populate/re-populate Kardex final grades ({filters})...")
+
+        last_id = 0 if restart else _load_checkpoint(checkpoint_path, filters)
+        if last_id:
+            print(f"Resuming after Kardex ID {last_id}.")
+
+        total = db.execute(_restricted(
+            select(func.count(Kardex.id)).where(Kardex.id > last_id), periodo_id, plan_estudio_id
+        )).scalar()
+        if not total:
+            print("No Kardex entries to update. Skipping population.")
+            return 0
+
+        final_grade = _final_grade()
+        processed = 0
+        started = time.perf_counter()
+        while True:
+            ids = db.execute(_restricted(
+                select(Kardex.id).where(Kardex.id > last_id), periodo_id, plan_estudio_id
+            ).order_by(Kardex.id).limit(batch_size)).scalars().all()
+            if not ids:
+                break
+
+            db.execute(
+                update(Kardex).where(Kardex.id.in_(ids)).values(
+                    calificacion_final=final_grade,
+                    aprobado=final_grade >= PASSING_GRADE
+                ).execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+            last_id = ids[-1]
+            processed += len(ids)
+            _save_checkpoint(checkpoint_path, filters, last_id)
+
+            elapsed = time.perf_counter() - started
+            rate = processed / elapsed if elapsed else 0
+            eta = (total - processed) / rate if rate else 0
+            print(f"  {processed}/{total} ({processed * 100 / total:.1f}%) up to Kardex ID {last_id}, "
+                  f"{rate:.0f} rows/s, ETA {eta:.0f}s")
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        print(f"\nKardex final grades population script finished successfully ({processed} entries).")
+        if rebuild_aggregates:
+            print("Rebuilding student aggregates...")
+            read_db = SessionLocal()
+            try:
+                rebuild_student_aggregates(read_db, db, batch_size)
+            finally:
+                read_db.close()
+        return processed
 
     except Exception as e:
         db.rollback()
         print(f"\nAn error occurred during Kardex grades population: {e}")
-        print("Kardex grades population failed and changes were rolled back.")
+        print("The current batch was rolled back; re-run to resume from the last checkpoint.")
+        raise
     finally:
         db.close()
 
 if __name__ == "__main__":
-    populate_kardex_grades()
+    parser = argparse.ArgumentParser(description="Recompute Kardex final grades from partial grades.")
+    parser.add_argument("--periodo-id", type=int, help="only inscripciones in this periodo")
+    parser.add_argument("--plan-id", type=int, help="only materias of this plan de estudio")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="checkpoint file ('' disables it)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+    populate_kardex_grades(args.periodo_id, args.plan_id, args.batch_size, args.checkpoint or None, args.restart)
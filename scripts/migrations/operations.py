@@ -0,0 +1,107 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+
+class Operation:
+    """One schema step of a revision. `statements` is what a dry run prints."""
+
+    def describe(self):
+        raise NotImplementedError
+
+    def statements(self, connection, online):
+        raise NotImplementedError
+
+    def is_applied(self, connection):
+        # Databases migrated by the old ad-hoc scripts already have most objects
+        return False
+
+    def apply(self, connection, online):
+        for statement in self.statements(connection, online):
+            connection.execute(text(statement))
+
+
+def _online_clause(connection, online):
+    # MySQL builds the change in place while reads and writes continue; if the change
+    # cannot be done that way the server rejects it instead of silently locking the table.
+    if online and connection.dialect.name == "mysql":
+        return ", ALGORITHM=INPLACE, LOCK=NONE"
+    return ""
+
+
+class CreateTables(Operation):
+    def __init__(self, metadata, tables=None):
+        self.metadata = metadata
+        self.tables = tables
+
+    def _missing(self, connection):
+        existing = set(inspect(connection).get_table_names())
+        tables = self.tables or self.metadata.sorted_tables
+        return [table for table in tables if table.name not in existing]
+
+    def describe(self):
+        return "create missing tables"
+
+    def is_applied(self, connection):
+        return not self._missing(connection)
+
+    def statements(self, connection, online):
+        return [str(CreateTable(table).compile(dialect=connection.dialect)).strip() for table in self._missing(connection)]
+
+    def apply(self, connection, online):
+        self.metadata.create_all(bind=connection, tables=self._missing(connection))
+
+
+class AddColumn(Operation):
+    def __init__(self, table, column, ddl):
+        self.table = table
+        self.column = column
+        self.ddl = ddl
+
+    def describe(self):
+        return f"add column {self.table}.{self.column}"
+
+    def is_applied(self, connection):
+        return self.column in {c["name"] for c in inspect(connection).get_columns(self.table)}
+
+    def statements(self, connection, online):
+        return [f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.ddl}{_online_clause(connection, online)}"]
+
+
+class CreateIndex(Operation):
+    def __init__(self, name, table, columns, unique=False):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.unique = unique
+
+    def describe(self):
+        return f"create index {self.name} on {self.table} ({', '.join(self.columns)})"
+
+    def is_applied(self, connection):
+        inspector = inspect(connection)
+        names = {i["name"] for i in inspector.get_indexes(self.table)}
+        names |= {c["name"] for c in inspector.get_unique_constraints(self.table)}
+        return self.name in names
+
+    def statements(self, connection, online):
+        columns = ", ".join(self.columns)
+        kind = "UNIQUE INDEX" if self.unique else "INDEX"
+        if connection.dialect.name == "mysql":
+            return [f"ALTER TABLE {self.table} ADD {kind} {self.name} ({columns}){_online_clause(connection, online)}"]
+        return [f"CREATE {kind} {self.name} ON {self.table} ({columns})"]
+
+
+class RunPython(Operation):
+    """Data step implemented in Python; it manages its own session and transaction."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def describe(self):
+        return f"run {self.func.__module__}.{self.func.__name__}"
+
+    def statements(self, connection, online):
+        return [f"-- python: {self.func.__module__}.{self.func.__name__}()"]
+
+    def apply(self, connection, online):
+        self.func()
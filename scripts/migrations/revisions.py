@@ -0,0 +1,56 @@
+from app.database import Base
+from app import models  # registers every table on Base.metadata
+from scripts.migration_populate_kardex_grades import populate_kardex_grades
+from scripts.rebuild_student_aggregates import rebuild_all_student_aggregates
+
+from .operations import AddColumn, CreateIndex, CreateTables, RunPython
+from .runner import Revision
+
+def _populate_kardex_grades():
+    # Student aggregates are rebuilt by revision 0009, once alumnos.puntos_ponderados exists
+    populate_kardex_grades(rebuild_aggregates=False)
+
+
+# Append new revisions at the end; never edit or reorder one that has been applied.
+# Indexes on large tables (asistencias, calificaciones_parciales, inscripciones) must use
+# CreateIndex so they are built online.
+REVISIONS = [
+    Revision("0001", "Create tables from the models", [
+        CreateTables(Base.metadata),
+    ]),
+    Revision("0002", "kardex.tipo_examen and materias.faltas_permitidas", [
+        AddColumn("kardex", "tipo_examen", "VARCHAR(255)"),
+        AddColumn("materias", "faltas_permitidas", "INTEGER"),
+    ]),
+    Revision("0003", "Graduation requirement unit fields", [
+        AddColumn("titulacion_requisitos", "unidades_requeridas", "INTEGER"),
+        AddColumn("titulacion_requisitos", "tipo_unidad", "VARCHAR(255)"),
+        AddColumn("alumno_titulacion", "unidades_cubiertas", "INTEGER"),
+    ]),
+    Revision("0004", "Populate kardex final grades", [
+        RunPython(_populate_kardex_grades),
+    ]),
+    Revision("0005", "asistencias (inscripcion_id, presente) index", [
+        CreateIndex("idx_asistencias_inscripcion_presente", "asistencias", ["inscripcion_id", "presente"]),
+    ]),
+    Revision("0006", "Foreign-key indexes for the /me and teacher lookups", [
+        CreateIndex("idx_docente_materia_docente_activo", "docente_materia", ["docente_id", "activo"]),
+        CreateIndex("idx_docente_materia_periodo_id", "docente_materia", ["periodo_id"]),
+        CreateIndex("idx_evaluaciones_alumno_profesor_materia", "evaluaciones", ["alumno_id", "profesor_id", "materia_id"]),
+        CreateIndex("idx_solicitudes_alumno_materia", "solicitudes", ["alumno_id", "materia_id"]),
+    ]),
+    Revision("0007", "horarios_alumno timetable read model", [
+        CreateTables(Base.metadata, tables=[models.HorarioAlumno.__table__]),
+    ]),
+    Revision("0008", "inscripciones_idempotencia keys for seat reservation", [
+        CreateTables(Base.metadata, tables=[models.InscripcionIdempotencia.__table__]),
+    ]),
+    Revision("0009", "alumnos.puntos_ponderados exact sum behind promedio_general", [
+        AddColumn("alumnos", "puntos_ponderados", "DECIMAL(12, 4)"),
+        RunPython(rebuild_all_student_aggregates),
+    ]),
+    Revision("0010", "Versioned horarios_alumno rows", [
+        AddColumn("alumnos", "horario_version", "INTEGER NOT NULL DEFAULT 0"),
+        AddColumn("horarios_alumno", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ]),
+]
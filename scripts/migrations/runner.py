@@ -0,0 +1,102 @@
+import time
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select
+
+
+class Revision:
+    def __init__(self, version, description, operations):
+        self.version = version
+        self.description = description
+        self.operations = operations
+
+
+version_metadata = MetaData()
+
+# One row per applied revision; the runner never re-applies a version found here
+schema_migrations = Table(
+    "schema_migrations", version_metadata,
+    Column("version", String(64), primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+    Column("duration_ms", Integer),
+)
+
+
+class MigrationRunner:
+    """
+    Applies ordered revisions and records each one in schema_migrations. Every step runs
+    in its own transaction (MySQL commits DDL implicitly anyway) and is skipped when the
+    object it creates already exists, so a revision interrupted halfway can be re-run.
+    """
+
+    def __init__(self, engine, revisions, online=True):
+        self.engine = engine
+        self.revisions = revisions
+        self.online = online
+        versions = [r.version for r in revisions]
+        if len(set(versions)) != len(versions):
+            raise ValueError("Duplicate migration versions")
+
+    def applied_versions(self, connection):
+        if not inspect(connection).has_table(schema_migrations.name):
+            return {}
+        rows = connection.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at)).all()
+        return {version: applied_at for version, applied_at in rows}
+
+    def pending(self, connection, target=None):
+        applied = self.applied_versions(connection)
+        pending = []
+        for revision in self.revisions:
+            if revision.version not in applied:
+                pending.append(revision)
+            if revision.version == target:
+                break
+        return pending
+
+    def status(self):
+        with self.engine.connect() as connection:
+            applied = self.applied_versions(connection)
+        return [(r.version, r.description, applied.get(r.version)) for r in self.revisions]
+
+    def dry_run(self, target=None):
+        with self.engine.connect() as connection:
+            for revision in self.pending(connection, target):
+                print(f"-- {revision.version}: {revision.description}")
+                for operation in revision.operations:
+                    if operation.is_applied(connection):
+                        print(f"-- already present: {operation.describe()}")
+                        continue
+                    for statement in operation.statements(connection, self.online):
+                        print(f"{statement};")
+                print()
+
+    def upgrade(self, target=None):
+        if target is not None and target not in {r.version for r in self.revisions}:
+            raise ValueError(f"Unknown migration version '{target}'")
+        version_metadata.create_all(bind=self.engine)
+        with self.engine.connect() as connection:
+            pending = self.pending(connection, target)
+        if not pending:
+            print("Database schema is up to date.")
+            return []
+
+        applied = []
+        for revision in pending:
+            print(f"\n[{revision.version}] {revision.description}")
+            started = time.perf_counter()
+            for index, operation in enumerate(revision.operations, start=1):
+                step_started = time.perf_counter()
+                with self.engine.begin() as connection:
+                    if operation.is_applied(connection):
+                        print(f"  ({index}/{len(revision.operations)}) {operation.describe()}: already present")
+                        continue
+                    operation.apply(connection, self.online)
+                print(f"  ({index}/{len(revision.operations)}) {operation.describe()}: {time.perf_counter() - step_started:.2f}s")
+
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            with self.engine.begin() as connection:
+                connection.execute(insert(schema_migrations).values(
+                    version=revision.version, description=revision.description, duration_ms=duration_ms
+                ))
+            print(f"  applied in {duration_ms / 1000:.2f}s")
+            applied.append(revision.version)
+        return applied
@@ -0,0 +1,45 @@
+import argparse
+import sys
+import os
+import time
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from app.aggregates import rebuild_student_aggregates
+
+def rebuild_all_student_aggregates(batch_size=1000):
+    """
+    Recomputes promedio_general, puntos_ponderados and the credit totals for every student
+    from the kardex. Run it after bulk grade loads that bypass the incremental maintainer
+    (e.g. scripts/migration_populate_kardex_grades.py).
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # The read session streams kardex rows while the write session commits each batch
+    read_db = SessionLocal()
+    write_db = SessionLocal()
+    started = time.perf_counter()
+
+    def progress(updated):
+        print(f"  {updated} students updated ({time.perf_counter() - started:.1f}s)")
+
+    try:
+        print("Rebuilding student aggregates...")
+        updated = rebuild_student_aggregates(read_db, write_db, batch_size, progress)
+        print(f"\nFinished: aggregates rebuilt for {updated} students.")
+    except Exception as e:
+        write_db.rollback()
+        print(f"\nAn error occurred: {e}")
+        print("The current batch was rolled back; committed batches are kept.")
+        raise
+    finally:
+        read_db.close()
+        write_db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild promedio_general and credit totals for every student.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    rebuild_all_student_aggregates(args.batch_size)
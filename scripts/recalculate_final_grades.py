@@ -0,0 +1,43 @@
+import argparse
+import sys
+import os
+import time
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from app.grades import recalculate_finals
+
+def recalculate_final_grades(grupo_id=None, periodo_id=None, batch_size=5000):
+    """
+    Recomputes weighted final grades after a grading policy change, for one grupo, one
+    periodo, or every kardex entry when neither is given.
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    started = time.perf_counter()
+
+    def progress(updated, last_id):
+        print(f"  {updated} final grades updated (up to Kardex ID {last_id}, {time.perf_counter() - started:.1f}s)")
+
+    try:
+        print(f"Recalculating final grades (grupo_id={grupo_id}, periodo_id={periodo_id})...")
+        updated = recalculate_finals(db, grupo_id, periodo_id, batch_size, progress)
+        print(f"\nFinished: {updated} final grades recalculated.")
+    except Exception as e:
+        db.rollback()
+        print(f"\nAn error occurred: {e}")
+        print("The current batch was rolled back; committed batches are kept.")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalculate weighted final grades.")
+    parser.add_argument("--grupo-id", type=int)
+    parser.add_argument("--periodo-id", type=int)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    recalculate_final_grades(args.grupo_id, args.periodo_id, args.batch_size)
@@ -0,0 +1,44 @@
+import sys
+import os
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from app.models import Alumno
+from app.fees import reconcile_document_fees
+
+BATCH_SIZE = 500
+
+def reconcile_all_document_fees():
+    """
+    Batch counterpart of the login-triggered fee job: walks every student in id order and
+    creates the pending documents fee for those still missing required documents.
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        print("Starting documents fee reconciliation...")
+        created = 0
+        last_id = 0
+        while True:
+            ids = [alumno_id for (alumno_id,) in db.query(Alumno.id).filter(
+                Alumno.id > last_id
+            ).order_by(Alumno.id).limit(BATCH_SIZE)]
+            if not ids:
+                break
+            created += reconcile_document_fees(db, ids)
+            last_id = ids[-1]
+            print(f"Processed students up to id {last_id} ({created} charges created so far)")
+
+        print(f"\nDocuments fee reconciliation finished. {created} charges created.")
+    except Exception as e:
+        db.rollback()
+        print(f"\nAn error occurred: {e}")
+        print("Reconciliation failed; the current batch was rolled back.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    reconcile_all_document_fees()
@@ -0,0 +1,37 @@
+import argparse
+import sys
+import os
+from collections import Counter
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import engine
+from app.schedule import periodo_conflict_report
+
+DIAS = {1: "LUNES", 2: "MARTES", 3: "MIERCOLES", 4: "JUEVES", 5: "VIERNES", 6: "SABADO", 7: "DOMINGO"}
+
+def report_conflicts(periodo_id):
+    """
+    Prints every teacher, room and student schedule overlap in a periodo.
+    Returns the number of conflicts found.
+    """
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionLocal()
+    try:
+        print(f"Checking schedule conflicts for periodo {periodo_id}...")
+        conflicts = periodo_conflict_report(db, periodo_id)
+        for c in sorted(conflicts, key=lambda c: (c.kind, str(c.resource), c.dia_semana)):
+            print(f"[{c.kind}] {c.resource} {DIAS.get(c.dia_semana, c.dia_semana)}: horario {c.horario_id} overlaps {c.other_horario_id}")
+        totals = Counter(c.kind for c in conflicts)
+        print(f"\n{len(conflicts)} conflict(s): " + ", ".join(f"{kind}={count}" for kind, count in sorted(totals.items())))
+        return len(conflicts)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report overlapping schedules in a periodo.")
+    parser.add_argument("periodo_id", type=int)
+    args = parser.parse_args()
+    sys.exit(1 if report_conflicts(args.periodo_id) else 0)